@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+
+Benchmarks of the data preprocessing and data analysis scripts (run from the root of the repository)
+1. synthetic.py: Synthetic raw and cleaned datasets shaped like the Calabash survey
+2. scaling.py: Time of each stage at several dataset sizes, saved as JSON: python -m benchmarks.scaling --help
+3. startup.py: Import time of the scripts: python benchmarks/startup.py
+"""
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+
+Scaling benchmark: time of each preprocessing stage, calculation method, statistical test table, table,
+report writer and plot on synthetic datasets of several sizes
+The results are saved as JSON (one file per run) and can be compared with the results of another version:
+python -m benchmarks.scaling --rows 1000 100000 1000000
+python -m benchmarks.scaling --rows 1000 100000 --compare benchmarks/results/(previous run).json
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import data_preprocessing as config
+import bodhi_data_preprocessing as dp
+import bodhi_data_analysis as bodhi
+import bodhi_indicator as bd
+import bodhi_PMF as pmf
+from bodhi_report import ReportWriter
+from bodhi_visual import ChartRenderer, render_chart, pyplot
+from benchmarks import synthetic
+
+
+def timed(results, name, function, *args, **kwargs):
+    """
+    - To run a function and keep its time (seconds) in the results
+    results: dic, Times of the benchmark
+    name: str, Name of the step
+    function: Function to run (with args and kwargs)
+    """
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    results[name] = round(time.perf_counter() - start, 4)
+    return value
+
+
+def preprocessing_benchmark(rows, folder, seed=0):
+    """
+    - Time of each stage of Preprocessing.processing() on a synthetic raw csv export
+    rows: int, Number of respondents
+    folder: str, Folder of the synthetic files
+    seed: int, Seed of the random number generator
+    """
+    synthetic.raw_dataset(rows, seed).to_csv(os.path.join(folder, 'raw.csv'), index=False)
+    settings = dict(del_type=0, file_type='csv', save_type='csv', multi_select=config.multi_select, value_maps=config.value_maps)
+    arguments = ['Benchmark', os.path.join(folder, 'raw'), os.path.join(folder, 'others.xlsx'), config.list_del_cols, config.dates,
+                 config.miss_col, config.identifiers, config.cols_new]
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        preprocessing = dp.Preprocessing(*arguments, **settings)
+        for stage, function, params in preprocessing.stages():
+            if stage != 'dates' or len(preprocessing.dates) != 0:
+                timed(results, stage, function)
+        preprocessing.file_path = os.path.join(folder, 'raw_cleaned')
+        timed(results, 'save', preprocessing.save_data)
+        stream = dp.Preprocessing(*arguments, chunksize=max(rows // 10, 1000), **settings)
+        timed(results, 'stream (total)', stream.processing)
+    return results
+
+
+def calculation_indicators(df):
+    """
+    - One indicator for each calculation method of Data_analysis.calculation()
+    df: Dataframe, Synthetic cleaned dataset
+    """
+    knowledge = {answer: number for number, answer in config.knowledge_map.items()}
+    q5 = [f'Q5_{number}' for number in range(1, 8)]
+    q8 = [f'Q8_{number}' for number in range(1, 7)]
+    answers = df[q8].replace({1: 'Yes', 0: 'No'}) # Yes/No answers for the 'score_select' methods
+    indicators = {}
+    indicator = bd.Indicator(df, 'Score', 1, ['Q4_dis_knowledge'], i_cal='score', i_type='percentage', description='score')
+    indicator.add_score_map(knowledge)
+    indicator.add_valid_point(3)
+    indicators['score'] = indicator
+    indicator = bd.Indicator(df, 'Divide', 2, ['Q5_total'], i_cal='divide', i_type='count', description='divide')
+    indicator.add_valid_point({2: 'Low', (2, 4): 'Medium', 4: 'High'})
+    indicators['divide'] = indicator
+    for method, point in [('score_average', 0.5), ('score_sum', 3)]:
+        indicator = bd.Indicator(df, method, 3, q5, i_cal=method, i_type='percentage', description=method)
+        indicator.add_score_map({1: 1, 0: 0})
+        indicator.add_valid_point(point)
+        indicators[method] = indicator
+    for method in ['score_select_allyes', 'score_select_allno', 'score_select_anyyes', 'score_select_anyno']:
+        indicators[method] = bd.Indicator(answers, method, 4, q8, i_cal=method, i_type='percentage', description=method)
+    return indicators
+
+
+def count_indicators(df, visual=False):
+    """
+    - Count indicators of the survey (single and multi-select questions, breakdowns and an intersection)
+    df: Dataframe, Synthetic cleaned dataset
+    visual: True/False, Option for data visualisation
+    """
+    indicators = []
+    for number, (col, order) in enumerate([('Q1_age', synthetic.ages), ('Q4_dis_knowledge', list(config.knowledge_map.values())),
+                                           ('Q6_source', synthetic.sources), ('Q10_barriers', synthetic.barriers)]):
+        indicator = bd.Indicator(df, col, number, [col], i_cal=None, i_type='count', description=col, visual=visual)
+        indicator.add_var_order(order)
+        indicator.add_breakdown({'Q2_sex': 'Gender', 'Q3_region': 'Region'})
+        indicators.append(indicator)
+    indicators[1].add_intersection({'Q2_sex': 'Gender', 'Q3_region': 'Region'})
+    indicator = bd.Indicator(df, 'Q5', 10, [f'Q5_{number}' for number in range(1, 8)], i_cal=None, i_type='count', description='Q5', visual=visual)
+    indicator.add_breakdown({'Q2_sex': 'Gender'})
+    indicator.add_var_change({1: 'Yes', 0: 'No'})
+    indicator.add_var_order([1, 0])
+    indicators.append(indicator)
+    return indicators
+
+
+def intersection_order(df):
+    """
+    - To check that the rows of an intersection table follow the order of the single breakdown tables: category
+      order for the categorical columns (as loaded by bodhi_dataset), sorted values for the others
+    - Return the breakdown columns whose order differs
+    df: Dataframe, Synthetic cleaned dataset
+    """
+    df = df.assign(Q2_sex=pd.Categorical(df['Q2_sex'], categories=synthetic.sexes, ordered=True),
+                   Q3_region=pd.Categorical(df['Q3_region'], categories=synthetic.regions, ordered=True))
+    tool = bodhi.Data_analysis('Benchmark', [])
+    var = ['Q4_dis_knowledge']
+    order = list(config.knowledge_map.values())
+    intersection = {'Q2_sex': 'Gender', 'Q3_region': 'Region', 'Q1_age': 'Age'}
+    table = tool.intersection_table(df, var, intersection, order)
+    differs = []
+    for col, name in intersection.items():
+        rows = list(dict.fromkeys(table.index.get_level_values(name)))
+        if rows != list(tool.breakdown_counts(df, var, col, order).columns):
+            differs.append(col)
+    return differs
+
+
+def analysis_benchmark(rows, folder, seed=0):
+    """
+    - Time of each calculation method, statistical test table, table, report writer and plot
+    rows: int, Number of respondents
+    folder: str, Folder of the output files
+    seed: int, Seed of the random number generator
+    """
+    import scipy.stats, statsmodels.tools.tools, openpyxl # The backends are imported on first use: their import time is not counted
+    pyplot()
+    df = synthetic.cleaned_dataset(rows, seed)
+    results = {'calculation': {}, 'tests': {}, 'tables': {}, 'writers': {}, 'plots': {}}
+    with contextlib.redirect_stdout(io.StringIO()):
+        tool = bodhi.Data_analysis('Benchmark', [])
+        for method, indicator in calculation_indicators(df).items():
+            timed(results['calculation'], method, tool.calculation, indicator, method)
+
+        groups = ['Q2_sex', 'Q3_region']
+        names = ['Gender', 'Region']
+        tests = results['tests']
+        timed(tests, 'chi', tool.chi2_table, df, groups, names, 'Q4_dis_knowledge')
+        timed(tests, 't-test', tool.t_test_table, df, ['Q2_sex'], ['Gender'], 'Q5_total')
+        timed(tests, 'anova', tool.anova_table, df, groups, names, 'Q5_total')
+        timed(tests, 'stats', tool.stats_table, df, groups, names, 'Q5_total')
+        timed(tests, 'ols', tool.ols_table, df, groups, 'Q5_total')
+        screening = bodhi.Data_analysis('Benchmark', count_indicators(df))
+        screening.indicator_analysis()
+        timed(tests, 'screening', screening.screening)
+
+        indicators = count_indicators(df, visual=True)
+        tool = bodhi.Data_analysis('Benchmark', indicators)
+        tool.indicator_analysis()
+        tool.renderer = ChartRenderer(jobs=0) # Chart specs only, rendered below
+        report = ReportWriter(os.path.join(folder, 'tables.xlsx'))
+        timed(results['tables'], 'evaluation', tool.evaluation, report, os.path.join(folder, 'visuals_'))
+        timed(results['writers'], 'xlsx', report.save, ['xlsx'])
+        timed(results['writers'], 'csv', report.save, ['csv'])
+
+        differs = intersection_order(df)
+        if len(differs) != 0:
+            raise ValueError(f"the rows of the intersection tables do not follow the order of the breakdown tables: {differs}")
+
+        for spec in tool.renderer.specs:
+            if spec['chart'] not in results['plots']:
+                timed(results['plots'], spec['chart'], render_chart, spec)
+
+        project = pmf.PerformanceManagementFramework('Benchmark', 'Evaluation')
+        project.add_indicators(count_indicators(df))
+        timed(results['tables'], 'PMF_generation (no plots)', project.PMF_generation, os.path.join(folder, 'stats.xlsx'),
+              os.path.join(folder, 'tests.xlsx'), os.path.join(folder, 'visuals_'), plots=False)
+    return results
+
+
+def version():
+    """
+    - Version of the scripts (git commit) and of the main libraries
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__}
+
+
+def flatten(results, prefix=''):
+    """
+    - Times of the results by step name: {'1000/preprocessing/load': 0.1}
+    results: dic, Results of the benchmark (nested)
+    """
+    times = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            times.update(flatten(value, f'{prefix}{name}/'))
+        else: times[f'{prefix}{name}'] = value
+    return times
+
+
+def compare(results, previous):
+    """
+    - To print the change of each time compared with a previous run (ratio > 1: slower)
+    results: dic, Results of this run
+    previous: dic, Results of a previous run (JSON file of this benchmark)
+    """
+    now = flatten(results['results'])
+    before = flatten(previous['results'])
+    print(f"\nCompared with {previous['version'].get('commit')} ({previous['created']})")
+    for name, seconds in now.items():
+        if name in before and before[name] > 0:
+            ratio = seconds / before[name]
+            flag = '  <- slower' if ratio > 1.2 and seconds - before[name] > 0.05 else ''
+            print(f"{name:60s} {before[name]:9.4f}s -> {seconds:9.4f}s  x{ratio:.2f}{flag}")
+
+
+def main(argv=None):
+    """
+    - Run the benchmark and save its results as JSON
+    argv: list, Command-line arguments (None: sys.argv)
+    """
+    parser = argparse.ArgumentParser(description='Scaling benchmark of the preprocessing and analysis scripts')
+    parser.add_argument('--rows', nargs='+', type=int, default=[1000, 100000, 1000000], help='Dataset sizes (number of respondents)')
+    parser.add_argument('--skip', nargs='+', choices=['preprocessing', 'analysis'], default=[], help='Parts of the benchmark not to run')
+    parser.add_argument('--output', default=os.path.join('benchmarks', 'results'), help='Folder of the JSON results')
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic datasets')
+    args = parser.parse_args(argv)
+
+    results = {'version': version(), 'created': datetime.datetime.now().isoformat(timespec='seconds'), 'results': {}}
+    for rows in args.rows:
+        results['results'][str(rows)] = {}
+        with tempfile.TemporaryDirectory() as folder:
+            if 'preprocessing' not in args.skip:
+                results['results'][str(rows)]['preprocessing'] = preprocessing_benchmark(rows, folder, args.seed)
+            if 'analysis' not in args.skip:
+                results['results'][str(rows)].update(analysis_benchmark(rows, folder, args.seed))
+        for name, seconds in flatten(results['results'][str(rows)], f'{rows}/').items():
+            print(f"{name:60s} {seconds:9.4f}s")
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"scaling_{results['version']['commit'] or 'local'}_{results['created'].replace(':', '')}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f"Results have been saved: {path}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+
+Startup benchmark: import time of the analysis scripts and of a tables-only run without plots
+Run from the root of the repository: python benchmarks/startup.py
+"""
+
+import subprocess
+import sys
+import os
+import json
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+heavy_modules = ['matplotlib', 'seaborn', 'scipy', 'statsmodels', 'openpyxl', 'IPython']
+
+# Each case runs in a new Python process, so the modules imported by a previous case do not hide the import time
+import_case = """
+import time
+start = time.perf_counter()
+import bodhi_PMF
+result = {'import': time.perf_counter() - start}
+"""
+
+tables_case = """
+import time
+start = time.perf_counter()
+import bodhi_PMF
+import bodhi_indicator as bd
+result = {'import': time.perf_counter() - start}
+import numpy as np
+import pandas as pd
+import tempfile
+import os
+
+rng = np.random.default_rng(0)
+n = 2000
+df = pd.DataFrame({'Q1_age': rng.choice(['15 - 19 years old', '20 - 24 years old', '25 - 30 years old'], n),
+                   'Q2_sex': rng.choice(['Male', 'Female'], n),
+                   'Q4_dis_knowledge': rng.choice(['No knowledge', 'Minimal knowledge', 'Basic knowledge'], n)})
+indicators = []
+for number, col in enumerate(['Q1_age', 'Q4_dis_knowledge']):
+    indicator = bd.Indicator(df, col, number, [col], i_cal=None, i_type='count', description=col, visual=False)
+    indicator.add_breakdown({'Q2_sex': 'Gender'})
+    indicators.append(indicator)
+
+start = time.perf_counter()
+pmf = bodhi_PMF.PerformanceManagementFramework('Startup', 'Evaluation')
+pmf.add_indicators(indicators)
+with tempfile.TemporaryDirectory() as folder:
+    pmf.PMF_generation(os.path.join(folder, 'tables.xlsx'), os.path.join(folder, 'tests.xlsx'), os.path.join(folder, 'visuals/'))
+result['run'] = time.perf_counter() - start
+"""
+
+report = """
+import sys
+result['modules'] = sorted(name for name in {modules} if name in sys.modules)
+print('RESULT ' + json.dumps(result))
+"""
+
+
+def run_case(code, repeat=3):
+    """
+    - To run a benchmark case in new Python processes and keep the fastest run
+    - Return the wall time of the process, the times measured inside it and the heavy modules it imported
+    code: str, Python code of the case (sets the dictionary result)
+    repeat: int, Number of runs
+    """
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', 'import json\n' + code + report.format(modules=heavy_modules)],
+                                cwd=root, capture_output=True, text=True, check=True).stdout
+        wall = time.perf_counter() - start
+        result = json.loads([line for line in output.splitlines() if line.startswith('RESULT ')][-1][len('RESULT '):])
+        result['process'] = wall
+        if best is None or wall < best['process']:
+            best = result
+    return best
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    for name, code in [('import bodhi_PMF', import_case), ('tables only, no plots', tables_case)]:
+        result = run_case(code, repeat)
+        times = ', '.join(f'{key} {result[key]:.2f}s' for key in ['process', 'import', 'run'] if key in result)
+        print(f"{name}: {times} | heavy modules: {', '.join(result['modules']) if result['modules'] else 'none'}")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+
+Synthetic survey datasets shaped like the Calabash survey (see data_preprocessing.py)
+1. raw_dataset(): Raw export (question texts as columns, multi-select answers such as '1,3', Likert codes,
+   duplicates and missing values)
+2. cleaned_dataset(): Cleaned dataset (columns of cols_new, without the deleted columns)
+"""
+
+import numpy as np
+import pandas as pd
+import data_preprocessing as config
+
+ages = ["15 - 19 years old", "20 - 24 years old", "25 - 30 years old", "31 - 34 years old", "35 and over"]
+sexes = ["Male", "Female"]
+regions = ["Banjul", "Lower River", "Central River", "Upper River", "Kanifing", "North Bank", "West Coast"]
+sources = ["Media (TV, Newspaper, Radio, Internet, etc.)", "Information from friends, relatives, and acquaintances",
+           "Everyday life experiences", "Education/training",
+           "Public institutions (health centers, hospitals, municipalities, etc.)", "I do not have any source of information", "Other"]
+excluded = ["Education", "Health", "Social life", "Career opportunities", "Home", "Other"]
+barriers = ["Lack of focused policies", "Lack of financial resources", "Inadequate legislative framework", "Lack of government interest",
+            "Lack of public interest", "Public ignorance/prejudices", "Lack of informed specialists/institutions", "All of the above"]
+multi_select_sizes = {'Q5_': 7, 'Q8_': 6} # Number of answers of the multi-select questions
+
+
+def raw_columns():
+    """
+    - Columns of the raw export, in the order renamed by cols_new (multi-select and Likert questions
+      use the question texts of data_preprocessing.py)
+    """
+    multi_select = {prefix: question for question, prefix in config.multi_select.items()}
+    likert = list(config.value_maps.keys())
+    return ['Timestamp', 'Consent', '1. How old are you?', '2. What is your sex?', '3. Please select the region the survey is conducted in',
+            likert[0], multi_select['Q5_'], '6. What is your main source of information on persons with disabilities?', likert[1],
+            multi_select['Q8_'], '9. From which areas do you think persons with disabilities are being excluded the most?',
+            '10. What do you think are the obstacles/barriers that keep persons with disabilities from having a better quality of life?']
+
+
+def multi_select_answers(rng, rows, size):
+    """
+    - Responses to a multi-select question ('1,3'), with one to three answers per respondent
+    - Each response is drawn as a set of answers (bit mask) and written from a table of the possible responses
+    rng: Generator, Random number generator
+    rows: int, Number of respondents
+    size: int, Number of answers of the question
+    """
+    masks = np.zeros(rows, dtype=np.int64)
+    for i in range(3):
+        picked = rng.integers(0, size, rows)
+        keep = (i == 0) | (rng.random(rows) < 0.4)
+        masks |= np.where(keep, 1 << picked, 0)
+    responses = np.array([','.join(str(answer + 1) for answer in range(size) if mask >> answer & 1) for mask in range(1 << size)], dtype=object)
+    return responses[masks], masks
+
+
+def respondents(rng, rows):
+    """
+    - Answers of the respondents shared by the raw and cleaned datasets
+    rng: Generator, Random number generator
+    rows: int, Number of respondents
+    """
+    data = {'Timestamp': pd.Timestamp('2024-07-18 08:00') + pd.to_timedelta(np.sort(rng.integers(0, 30 * 24 * 3600, rows)), unit='s'),
+            'Consent': np.full(rows, 'Yes', dtype=object),
+            'Q1_age': rng.choice(ages, rows), 'Q2_sex': rng.choice(sexes, rows), 'Q3_region': rng.choice(regions, rows),
+            'Q4_dis_knowledge': rng.integers(1, 6, rows), 'Q6_source': rng.choice(sources, rows),
+            'Q7_policy_knowledge': rng.integers(1, 6, rows), 'Q9_excluded': rng.choice(excluded, rows),
+            'Q10_barriers': rng.choice(barriers, rows)}
+    for prefix, size in multi_select_sizes.items():
+        data[prefix] = multi_select_answers(rng, rows, size)
+    return data
+
+
+def raw_dataset(rows, seed=0, duplicates=0.01, missing=0.01):
+    """
+    - Synthetic raw export of the survey
+    rows: int, Number of respondents
+    seed: int, Seed of the random number generator
+    duplicates: float, Share of the respondents submitted twice
+    missing: float, Share of missing answers in the questions answered by all the respondents
+    """
+    rng = np.random.default_rng(seed)
+    data = respondents(rng, rows)
+    columns = raw_columns()
+    df = pd.DataFrame({columns[0]: data['Timestamp'], columns[1]: data['Consent'], columns[2]: data['Q1_age'],
+                       columns[3]: data['Q2_sex'], columns[4]: data['Q3_region'], columns[5]: data['Q4_dis_knowledge'],
+                       columns[6]: data['Q5_'][0], columns[7]: data['Q6_source'], columns[8]: data['Q7_policy_knowledge'],
+                       columns[9]: data['Q8_'][0], columns[10]: data['Q9_excluded'], columns[11]: data['Q10_barriers']})
+    for col in [columns[2], columns[3], columns[4], columns[7], columns[10], columns[11]]:
+        df.loc[rng.random(rows) < missing, col] = None
+    repeated = rng.choice(rows, int(rows * duplicates), replace=False)
+    return pd.concat([df, df.iloc[np.sort(repeated)]], ignore_index=True)
+
+
+def cleaned_dataset(rows, seed=0):
+    """
+    - Synthetic cleaned dataset of the survey (columns of cols_new without the deleted columns)
+    - Q5_total (number of types of disabilities known) is added as a continuous variable for the statistical tests
+    rows: int, Number of respondents
+    seed: int, Seed of the random number generator
+    """
+    rng = np.random.default_rng(seed)
+    data = respondents(rng, rows)
+    knowledge = np.array(list(config.knowledge_map.values()), dtype=object)
+    df = pd.DataFrame({'Timestamp': data['Timestamp'], 'Consent': data['Consent'], 'Q1_age': data['Q1_age'], 'Q2_sex': data['Q2_sex'],
+                       'Q3_region': data['Q3_region'], 'Q4_dis_knowledge': knowledge[data['Q4_dis_knowledge'] - 1],
+                       'Q6_source': data['Q6_source'], 'Q7_policy_knowledge': knowledge[data['Q7_policy_knowledge'] - 1],
+                       'Q9_excluded': data['Q9_excluded'], 'Q10_barriers': data['Q10_barriers']})
+    for prefix, size in multi_select_sizes.items():
+        masks = data[prefix][1]
+        for answer in range(size):
+            df[f'{prefix}{answer + 1}'] = (masks >> answer & 1).astype(np.int64)
+    df = df[[col for col in config.cols_new if col in df.columns]]
+    df['Q5_total'] = df[[f'Q5_{answer + 1}' for answer in range(7)]].sum(axis=1)
+    return df
@@ -6,20 +6,29 @@ Created on Tue Sep 17 15:47:28 2024
 @author: Bodhi Global Analysis (Jungyeon Lee)
 """
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 import bodhi_data_analysis as bodhi
+from bodhi_report import ReportWriter
+from bodhi_visual import ChartRenderer, chart_manifest
+from bodhi_cache import ResultCache, indicator_fingerprint
+from bodhi_cube import SurveyCube
+from bodhi_aggregate import AggregateCube
+from bodhi_monitor import RunMonitor, monitor_stage
 
 class PerformanceManagementFramework:
     
-    def __init__(self, name, ptype):
+    def __init__(self, name, ptype, monitor=None):
         """
         - Initialise the Performance Management Framework class
 
         name: str, Name of the project
         ptype: str, Type of the project (KAP, Evaluation)
+        monitor: RunMonitor, Run monitor measuring each stage and indicator of the run (None: not measured)
         """
         self.name = name
         self.ptype = ptype
         self.indicators = []
+        self.monitor = monitor
 
     def add_indicators(self, indicators):
         """
@@ -31,29 +40,171 @@ class PerformanceManagementFramework:
             self.indicators.append(indicator)
             print(f'{indicator.indicator_name} has been added to the data analysis pipeline')
             
-        self.tool = bodhi.Data_analysis(self.name, self.indicators)
+        self.tool = bodhi.Data_analysis(self.name, self.indicators, monitor=self.monitor)
         self.tool.indicator_analysis()
         return True
 
  
-    def PMF_generation(self, file_path1, file_path2, folder):
+    def PMF_generation(self, file_path1, file_path2, folder, jobs=1, render_jobs=None, chart_cache=True, cache=None, screening=False,
+                       plots=True, tests=True, formats=None, aggregates=None):
         """
         - Generate tables from all the indicators
         file_path1: str, Directory to save the tables
         file_path2: str, Directory to save the chi2 test results
         folder: str, Directory to save the plots
+        jobs: int, Number of processes analysing the indicators in parallel (1: no parallel processing)
+        render_jobs: int, Number of processes rendering the plots (None: same as jobs)
+        chart_cache: True/False, Skip the plots whose data and settings have not changed since the last run
+        cache: str, Folder of the result cache, indicators whose data and settings have not changed reuse
+               their tables and test results from the last run (None: no result cache)
+        screening: True/False, Add a 'Screening' sheet to the test results: chi-square tests of every categorical
+                   indicator by every breakdown column of the indicators, ranked by p-value with Holm and Benjamini-Hochberg corrections
+        plots: True/False, Render the plots (False: no plots, matplotlib is not imported)
+        tests: True/False, Run the statistical tests (False: the indicators with a test are left out and
+               the test results are not saved)
+        formats: list, Formats of the tables and test results ('xlsx', 'csv'; None: ['xlsx'])
+        aggregates: AggregateStore, Aggregate store: the indicators are counted on the new rows only (AggregateStore.new_rows()),
+                    their counts are added to the stored counts and the tables and plots are made from all the counts
+                    (the statistical tests and the result cache are not used, the indicators are analysed in this process)
         """
-        empty_df1 = pd.DataFrame()
-        with pd.ExcelWriter(file_path1, engine='openpyxl') as writer:
-            empty_df1.to_excel(writer, sheet_name='Tables', index=False)
-            
-        empty_df2 = pd.DataFrame()
-        with pd.ExcelWriter(file_path2, engine='openpyxl') as writer:
-            empty_df2.to_excel(writer, sheet_name='Chi2 Tests', index=False)
+        if aggregates is not None:
+            if tests == True and any(indicator.s_test is not None for indicator in self.indicators):
+                print("The statistical tests need the data points: they are not run with the aggregate store")
+            tests = False
+            cache = None
+            jobs = 1
+        with monitor_stage(self.monitor, 'run', 'PMF_generation', jobs=jobs):
+            self.generation(file_path1, file_path2, folder, jobs, render_jobs, chart_cache, cache, screening, plots, tests, formats, aggregates)
+        if self.monitor is not None:
+            self.monitor.print_summary()
+        print("\nData analysis has been finished")
+
+    def generation(self, file_path1, file_path2, folder, jobs, render_jobs, chart_cache, cache, screening, plots, tests, formats, aggregates=None):
+        """
+        - Generate the tables, test results and plots (see PMF_generation())
+        """
+        monitor = self.monitor
+        tables_report = ReportWriter(file_path1, first_sheet='Tables')
+        tests_report = ReportWriter(file_path2, first_sheet='Chi2 Tests')
+        if render_jobs is None:
+            render_jobs = jobs
+        manifest = None
+        if chart_cache == True:
+            manifest = chart_manifest(folder)
+        renderer = ChartRenderer(render_jobs, manifest=manifest, monitor=monitor) if plots == True else None
+        results = ResultCache(cache) if cache is not None else None
             
         if self.ptype == 'Evaluation':
-            self.tool.statistical_test(file_path2, folder)
-            self.tool.evaluation(file_path1, folder)
+            selected = [number for number, indicator in enumerate(self.indicators) if tests == True or indicator.s_test is None]
+            reports = {}
+            keys = {}
+            for number in selected:
+                if results is not None:
+                    keys[number] = indicator_fingerprint(self.indicators[number], folder)
+                    report = results.get(keys[number])
+                    if report is not None:
+                        reports[number] = report
+            todo = [number for number in selected if number not in reports]
+            if results is not None:
+                print(f"{len(reports)} indicators have been loaded from the result cache, {len(todo)} indicators will be analysed")
+
+            # OLS indicators sharing their dataset and independent variables are fitted together
+            indicators = [self.indicators[number] for number in todo]
+            with monitor_stage(monitor, 'tests', 'OLS batches'):
+                ols_results = bodhi.Data_analysis(self.name, indicators).ols_batches()
+
+            if jobs > 1 and len(todo) > 1:
+                # Each worker receives the indicators once, then analyses them one by one
+                with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                         initargs=(self.name, indicators, ols_results, None if monitor is None else monitor.settings())) as pool:
+                    for number, (report, events) in zip(todo, pool.map(worker_report, range(len(todo)), [folder] * len(todo))):
+                        reports[number] = report
+                        if monitor is not None:
+                            monitor.extend(events) # Measured in the worker process
+            else:
+                cube = SurveyCube() if aggregates is None else AggregateCube(aggregates) # Counts shared by the indicators
+                for number in todo:
+                    reports[number] = indicator_report(self.name, self.indicators[number], folder, ols_results, cube, monitor)
+
+            for number in selected:
+                test_sheets, table_sheets, specs = reports[number]
+                if results is not None and number in todo:
+                    results.put(keys[number], reports[number])
+                tests_report.merge(test_sheets)
+                tables_report.merge(table_sheets)
+                if renderer is not None:
+                    for spec in specs:
+                        renderer.submit(spec)
+
+            if screening == True and tests == True:
+                with monitor_stage(monitor, 'tests', 'Screening', indicators=len(self.indicators)):
+                    screening_df = bodhi.Data_analysis(self.name, self.indicators).screening()
+                tests_report.add_sheet('Screening', [(screening_df, {'index': True, 'header': True})],
+                                       description='Chi-square tests of all the indicators by all the breakdown columns (ranked by p-value)')
+
+        with monitor_stage(monitor, 'writer', 'Tables', sheets=len(tables_report.sheets)):
+            tables_report.save(formats)
+        if tests == True:
+            with monitor_stage(monitor, 'writer', 'Test results', sheets=len(tests_report.sheets)):
+                tests_report.save(formats)
+        if renderer is not None:
+            with monitor_stage(monitor, 'plot', 'Waiting for the plots'):
+                renderer.wait()
+        if aggregates is not None:
+            with monitor_stage(monitor, 'writer', 'Aggregate store'):
+                aggregates.commit()
+
+
+def indicator_report(name, indicator, folder, ols_results=None, cube=None, monitor=None):
+    """
+    - Run the statistical tests and tables of one indicator
+    - Return the sheets of the test results and tables (merged in indicator order by PMF_generation)
+      and the chart specs of the plots (rendered by PMF_generation)
+    name: str, Name of the project
+    indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+    folder: str, Directory to save the plots
+    ols_results: dic, OLS results already fitted by Data_analysis.ols_batches() (by indicator name)
+    cube: SurveyCube, Counts shared with the other indicators (None: counts of this indicator only)
+    monitor: RunMonitor, Run monitor measuring the tables and tests of the indicator (None: not measured)
+    """
+    tool = bodhi.Data_analysis(name, [indicator], cube=cube, monitor=monitor)
+    if ols_results is not None and indicator.indicator_name in ols_results:
+        tool.ols_results = {indicator.indicator_name: ols_results[indicator.indicator_name]}
+    tool.renderer = ChartRenderer(jobs=0)
+    tests = ReportWriter(None)
+    tables = ReportWriter(None)
+    tool.statistical_test(tests, folder)
+    tool.evaluation(tables, folder)
+    return tests.sheets, tables.sheets, tool.renderer.specs
+
+
+_worker = {}
+
+def init_worker(name, indicators, ols_results=None, monitor=None):
+    """
+    - Prepare a worker process of PMF_generation
+    name: str, Name of the project
+    indicators: list, Indicators analysed by the workers
+    ols_results: dic, OLS results already fitted by Data_analysis.ols_batches() (by indicator name)
+    monitor: dic, Profile settings of the run monitor (RunMonitor.settings()) to measure the tables and tests of
+             the indicators, their events are sent back by worker_report() (None: not measured)
+    """
+    _worker['name'] = name
+    _worker['indicators'] = indicators
+    _worker['ols_results'] = ols_results
+    _worker['cube'] = SurveyCube() # Counts shared by the indicators of this worker
+    _worker['monitor'] = RunMonitor(**monitor) if monitor is not None else None
 
-        
-        print("\nData analysis has been finished")
\ No newline at end of file
+def worker_report(number, folder):
+    """
+    - Run indicator_report() in a worker process
+    - Return the report of the indicator and the events measured for it (empty if the run is not monitored)
+    number: int, Position of the indicator in the list given to init_worker()
+    folder: str, Directory to save the plots
+    """
+    monitor = _worker['monitor']
+    report = indicator_report(_worker['name'], _worker['indicators'][number], folder, _worker['ols_results'], _worker['cube'], monitor)
+    if monitor is None:
+        return report, []
+    events, monitor.events = monitor.events, []
+    return report, events
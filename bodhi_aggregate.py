@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+from bodhi_cube import SurveyCube
+
+
+class AggregateStore:
+
+    def __init__(self, path, rebuild=False):
+        """
+        - Initialise the aggregate store class
+        - The counts of the indicators (by variable, breakdown and intersection) are additive: they are kept in a
+          SQLite file, and each run only counts the rows added to the cleaned dataset since the last run and adds
+          them to the stored counts (e.g. the daily exports of the fieldwork, see the append mode of the preprocessing)
+        - The percentages, tables and charts are then made from the stored counts, the statistical tests (which
+          need the data points) are not run with the aggregate store
+
+        path: str, Directory of the SQLite file (e.g., 'data/aggregates.sqlite')
+        rebuild: True/False, Delete the stored counts first (e.g. after the indicators or the cleaned dataset changed)
+        """
+        self.path = path
+        if os.path.dirname(path) != '':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        if rebuild == True:
+            self.connection.executescript("DROP TABLE IF EXISTS tables; DROP TABLE IF EXISTS state;")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS tables (key TEXT PRIMARY KEY, kind TEXT, scope TEXT, var TEXT, by TEXT,
+                                               rows INTEGER, counts TEXT, updated TEXT);
+            CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value TEXT);""")
+        state = dict(self.connection.execute("SELECT name, value FROM state").fetchall())
+        self.rows = int(state.get('rows', 0)) # Rows of the cleaned dataset already counted
+        self.last_row = json.loads(state.get('last_row', 'null')) # Values of the last row counted
+        self.dataset_rows = self.rows
+        self.dataset_last_row = self.last_row
+        self.pending = {} # Merged counts of this run, saved by commit()
+        self.errors = [] # Tables that could not be merged in this run (nothing is saved by commit())
+
+    def new_rows(self, df):
+        """
+        - To keep the rows of the cleaned dataset that are not counted yet
+        - Return None if the dataset does not start with the rows already counted (e.g. it was processed again
+          from the start, the store must then be rebuilt)
+        df: Dataframe, Cleaned dataset (all the rows, in the order they were added)
+        """
+        if len(df) < self.rows:
+            print(f"The dataset has {len(df)} rows but {self.rows} rows have already been counted in {self.path}, please rebuild the aggregate store")
+            return None
+        if self.rows > 0:
+            row = row_values(df, self.rows - 1)
+            changed = [col for col in row if col in self.last_row and row[col] != self.last_row[col]]
+            if len(changed) != 0:
+                print(f"The rows already counted in {self.path} have changed (columns {changed}), please rebuild the aggregate store")
+                return None
+        self.dataset_rows = len(df)
+        self.dataset_last_row = row_values(df, len(df) - 1) if len(df) > 0 else None
+        print(f"Aggregate store: {self.rows} rows already counted | New rows: {len(df) - self.rows}")
+        return df.iloc[self.rows:].reset_index(drop=True)
+
+    def stored(self, key):
+        """
+        - Stored counts of a table (None if it is not in the store)
+        key: str, Key of the table (see AggregateCube.table_key())
+        """
+        found = self.connection.execute("SELECT rows, counts FROM tables WHERE key = ?", (key,)).fetchone()
+        if found is None:
+            return None
+        return found[0], decode_table(json.loads(found[1]))
+
+    def merge(self, key, table, description):
+        """
+        - To add the counts of the new rows to the stored counts of a table (kept until commit())
+        - Categories (rows and columns) keep their stored order, new categories are added after them
+        key: str, Key of the table
+        table: series or Dataframe, Counts of the new rows (from SurveyCube)
+        description: dic, Kind, scope, variable and breakdown of the table (saved with the counts)
+        """
+        if key in self.pending:
+            return self.pending[key][1]
+        stored = self.stored(key)
+        error = None
+        if stored is None and self.rows > 0:
+            error = f"the counts of '{description['var']}' by {description['by']} are not in the aggregate store, please rebuild it"
+        elif stored is not None and stored[0] != self.rows:
+            error = f"the counts of '{description['var']}' by {description['by']} were last updated at {stored[0]} rows, please rebuild the aggregate store"
+        if error is not None:
+            self.errors.append(error)
+            raise ValueError(error)
+        if stored is not None:
+            table = merge_tables(stored[1], table)
+        self.pending[key] = (description, table)
+        return table
+
+    def commit(self):
+        """
+        - To save the merged counts of this run and the number of rows counted
+        - Nothing is saved if a table could not be merged: the stored counts stay those of the last run
+        """
+        if len(self.errors) != 0:
+            print(f"{len(self.errors)} count tables could not be merged, the aggregate store has not been updated: {self.path}")
+            self.pending = {}
+            return False
+        updated = datetime.datetime.now().isoformat(timespec='seconds')
+        with self.connection:
+            for key, (description, table) in self.pending.items():
+                self.connection.execute("INSERT OR REPLACE INTO tables VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                        (key, description['kind'], description['scope'], description['var'], json.dumps(description['by']),
+                                         self.dataset_rows, json.dumps(encode_table(table), default=json_value), updated))
+            self.connection.executemany("INSERT OR REPLACE INTO state VALUES (?, ?)",
+                                        [('rows', str(self.dataset_rows)), ('last_row', json.dumps(self.dataset_last_row)), ('updated', updated)])
+        print(f"{len(self.pending)} count tables have been saved in the aggregate store: {self.path} ({self.dataset_rows} rows counted)")
+        self.rows = self.dataset_rows
+        self.last_row = self.dataset_last_row
+        self.pending = {}
+        return True
+
+    def close(self):
+        """
+        - To close the SQLite file
+        """
+        self.connection.close()
+        return True
+
+
+class AggregateCube(SurveyCube):
+
+    def __init__(self, store):
+        """
+        - Initialise the aggregate cube class
+        - Survey cube counting the new rows of the dataset and adding the counts stored in the aggregate store,
+          the tables of the indicators are then made from the counts of all the rows
+        - The counts of an indicator are stored by the columns they use and the rows they are counted on (condition
+          and calculation of the indicator), conditions must be declarative (see Indicator.add_condition())
+
+        store: AggregateStore, Aggregate store of the project
+        """
+        super().__init__()
+        self.store = store
+        self.merged = {}
+
+    def scope(self, df, col):
+        """
+        - Rows and calculation of a column of an indicator, as they are kept in the store
+        df: Dataframe or Indicator, Dataset
+        col: str, Column of the dataset
+        """
+        if isinstance(df, pd.DataFrame):
+            return ['data', None]
+        if df.condition is not None and not isinstance(df.condition, tuple):
+            raise ValueError(f"{df.indicator_name} has no declarative condition, its counts cannot be stored")
+        calculation = [df.indicator_name, df.i_cal, df.score_map, df.valid_point, df.var_change]
+        if df.derived is not None and col in df.derived.columns:
+            return ['derived', df.condition, calculation]
+        # 'divide' leaves out the rows without a value, the other calculations keep the rows of the condition
+        return ['data', df.condition, calculation if df.i_cal == 'divide' else None]
+
+    def table_key(self, kind, df, var, by):
+        """
+        - Key and description of a table of counts in the store
+        kind: str, 'counts' or 'intersection'
+        df: Dataframe or Indicator, Dataset
+        var: str, Variable
+        by: str or list, Breakdown column(s) (None: no breakdown)
+        """
+        columns = [var] + ([] if by is None else [by] if isinstance(by, str) else list(by))
+        scope = repr([kind] + [(col, self.scope(df, col)) for col in columns])
+        description = {'kind': kind, 'scope': scope, 'var': var, 'by': by}
+        return hashlib.sha256(scope.encode('utf-8')).hexdigest(), description
+
+    def counts(self, df, var, by=None):
+        """
+        - Counts of a variable (by the categories of a breakdown column) on all the rows: the new rows are counted
+          as SurveyCube.counts() and the stored counts are added
+        df: Dataframe or Indicator, Dataset
+        var: str, Variable (column of the dataset)
+        by: str, Breakdown column (None: no breakdown)
+        """
+        key, description = self.table_key('counts', df, var, by)
+        if key not in self.merged:
+            self.merged[key] = self.store.merge(key, super().counts(df, var, by), description)
+        return self.merged[key]
+
+    def intersection_counts(self, df, var, by):
+        """
+        - Counts of a variable by the combinations of the categories of several breakdown columns on all the rows
+          (see SurveyCube.intersection_counts())
+        df: Dataframe or Indicator, Dataset
+        var: str, Variable (column of the dataset)
+        by: list, Breakdown columns
+        """
+        key, description = self.table_key('intersection', df, var, list(by))
+        if key not in self.merged:
+            table = self.store.merge(key, super().intersection_counts(df, var, by), description)
+            # Levels in category order for the categorical columns and sorted for the others, as SurveyCube
+            levels = []
+            level_codes = []
+            for number, col in enumerate(by):
+                values = table.index.get_level_values(number)
+                codes, categories, categorical = self.category_codes(df, col)
+                if categorical == True:
+                    level = categories.append(pd.Index(values.unique()).difference(categories))
+                else: level = pd.Index(values.unique()).sort_values()
+                levels.append(level)
+                level_codes.append(level.get_indexer(values))
+            table = table.copy()
+            table.index = pd.MultiIndex(levels=levels, codes=level_codes, names=list(by))
+            self.merged[key] = table
+        return self.merged[key]
+
+
+def json_value(value):
+    """
+    - JSON value of a numpy value (or text of the other values)
+    value: Value of a category
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def row_values(df, position):
+    """
+    - Values of a row of the dataset as JSON text by column (to check that the counted rows have not changed)
+    df: Dataframe, Dataset
+    position: int, Position of the row
+    """
+    values = {}
+    for col, value in df.iloc[position].items():
+        if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_)):
+            value = float(value) # Same text when a column is read as integers, then as floats (missing values)
+        values[col] = json.dumps(value, default=json_value)
+    return values
+
+
+def labels(index):
+    """
+    - Labels of an index (lists for a MultiIndex)
+    index: Index, Index of a table of counts
+    """
+    if isinstance(index, pd.MultiIndex):
+        return [list(label) for label in index]
+    return list(index)
+
+
+def encode_table(table):
+    """
+    - Table of counts as a JSON-ready dic
+    table: series or Dataframe, Table of counts
+    """
+    encoded = {'index': labels(table.index), 'names': list(table.index.names), 'multi': isinstance(table.index, pd.MultiIndex)}
+    if isinstance(table, pd.Series):
+        encoded.update({'name': table.name, 'counts': table.tolist()})
+    else: encoded.update({'columns': labels(table.columns), 'column_name': table.columns.name, 'counts': table.values.tolist()})
+    return encoded
+
+
+def decode_table(encoded):
+    """
+    - Table of counts from encode_table()
+    encoded: dic, Encoded table of counts
+    """
+    if encoded['multi'] == True:
+        index = pd.MultiIndex.from_tuples([tuple(label) for label in encoded['index']], names=encoded['names'])
+    else: index = pd.Index(encoded['index'], name=encoded['names'][0])
+    if 'columns' not in encoded:
+        return pd.Series(np.array(encoded['counts'], dtype=np.int64), index=index, name=encoded['name'])
+    columns = pd.Index(encoded['columns'], name=encoded['column_name'])
+    counts = np.array(encoded['counts'], dtype=np.int64).reshape(len(index), len(columns))
+    return pd.DataFrame(counts, index=index, columns=columns)
+
+
+def merge_tables(stored, table):
+    """
+    - To add two tables of counts: the categories of the stored table first, then the new categories
+    stored: series or Dataframe, Stored counts
+    table: series or Dataframe, Counts of the new rows
+    """
+    index = stored.index.append(table.index[~table.index.isin(stored.index)])
+    if isinstance(table, pd.Series):
+        merged = stored.reindex(index, fill_value=0) + table.reindex(index, fill_value=0)
+        merged.name = table.name
+    else:
+        columns = stored.columns.append(table.columns[~table.columns.isin(stored.columns)])
+        merged = stored.reindex(index=index, columns=columns, fill_value=0) + table.reindex(index=index, columns=columns, fill_value=0)
+        merged.columns.name = table.columns.name
+    merged.index.names = table.index.names
+    return merged.astype(np.int64)
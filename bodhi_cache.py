@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import pandas as pd
+import hashlib
+import os
+import pickle
+
+cache_version = 3 # Increase when the analysis code changes so that cached results are computed again
+
+
+class ResultCache:
+
+    def __init__(self, folder):
+        """
+        - Initialise the result cache class
+        - Results of each indicator are saved as one file named after the fingerprint of the indicator
+
+        folder: str, Directory where the cached results are saved
+        """
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def get(self, key):
+        """
+        - Load a cached result (None if it is not cached)
+        key: str, Fingerprint of the indicator
+        """
+        if key is None:
+            return None
+        path = os.path.join(self.folder, f'{key}.pkl')
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"Cached result {path} could not be loaded: {e}")
+            return None
+
+    def put(self, key, result):
+        """
+        - Save the result of an indicator
+        key: str, Fingerprint of the indicator
+        result: Result of the indicator (picklable)
+        """
+        if key is None:
+            return False
+        path = os.path.join(self.folder, f'{key}.pkl')
+        with open(f'{path}.tmp', 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f'{path}.tmp', path)
+        return True
+
+
+def indicator_fingerprint(indicator, *extra):
+    """
+    - Fingerprint of an indicator: its settings and the rows and columns of the dataset it uses
+    - Return None if the fingerprint cannot be calculated (e.g., missing columns)
+    indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+    extra: Other values changing the result (e.g., the folder of the plots)
+    """
+    settings = [cache_version, indicator.name, indicator.number, indicator.indicator_name, indicator.var, indicator.var_type,
+                indicator.i_cal, indicator.i_type, indicator.description, indicator.period, indicator.target,
+                indicator.baseline, indicator.midline, indicator.var_order, indicator.var_change, indicator.score_map,
+                indicator.valid_point, indicator.breakdown, indicator.intersections, indicator.kap_label, indicator.s_test, indicator.s_group,
+                indicator.visual, extra]
+    digest = hashlib.sha256(repr(settings).encode('utf-8'))
+    try:
+        data = indicator.data(indicator.columns())
+        # hash_pandas_object() ignores the order of the categories, which orders the rows and columns of the tables
+        dtypes = [(str(dtype), dtype.categories.tolist(), dtype.ordered) if isinstance(dtype, pd.CategoricalDtype) else str(dtype)
+                  for dtype in data.dtypes]
+        digest.update(repr(dtypes).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    except Exception as e:
+        print(f"{indicator.indicator_name} cannot be cached: {e}")
+        return None
+    return digest.hexdigest()
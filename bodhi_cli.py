@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+
+Command-line runner of the PMF
+The indicators and the settings of the run come from a definition module (e.g., bodhi_pipeline.py) with:
+1. define_indicators(df): function returning the indicators, defined on the columns of the dataset
+2. Settings (optional, replaced by the options): project_name, project_type, data_path, file_path1, file_path2,
+   folder, jobs, cache, screening, monitor_log, profile_folder, profile_modes, aggregates
+
+For example:
+python bodhi_cli.py bodhi_pipeline.py --only Sex Knowledge_level --no-plots --no-tests
+python bodhi_cli.py bodhi_pipeline.py --jobs 4 --formats xlsx csv
+python bodhi_cli.py bodhi_pipeline.py --monitor data/events.jsonl
+python bodhi_cli.py bodhi_pipeline.py --only Sex --profile data/profiles --profile-modes cpu
+python bodhi_cli.py bodhi_pipeline.py --aggregates data/aggregates.sqlite
+"""
+
+import argparse
+import importlib
+import importlib.util
+import os
+import sys
+
+
+def load_definitions(definitions):
+    """
+    - To load the definition module of the indicators
+    definitions: str, File path (e.g., 'bodhi_pipeline.py') or name of the module (e.g., 'bodhi_pipeline')
+    """
+    if definitions.endswith('.py') or os.path.exists(definitions):
+        folder = os.path.dirname(os.path.abspath(definitions))
+        if folder not in sys.path:
+            sys.path.insert(0, folder) # The definition module can import the scripts next to it
+        name = os.path.splitext(os.path.basename(definitions))[0]
+        spec = importlib.util.spec_from_file_location(name, definitions)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module # Needed by the worker processes (jobs > 1)
+        spec.loader.exec_module(module)
+        return module
+    return importlib.import_module(definitions)
+
+
+def select_indicators(indicators, names):
+    """
+    - To keep the indicators given by their name (e.g., 'Sex') or numbered name (e.g., '0.Sex')
+    - Return the selected indicators (in the order of the definitions) and the names matching no indicator
+    indicators: list, List of the project indicators
+    names: list, Names of the indicators to keep (None: all the indicators)
+    """
+    if names is None:
+        return indicators, []
+    selected = [indicator for indicator in indicators if indicator.name in names or indicator.indicator_name in names]
+    found = {indicator.name for indicator in selected} | {indicator.indicator_name for indicator in selected}
+    return selected, [name for name in names if name not in found]
+
+
+def parser():
+    """
+    - Options of the command-line runner
+    """
+    parser = argparse.ArgumentParser(description='Generate the PMF tables, test results and plots of the indicators')
+    parser.add_argument('definitions', help="Definition module of the indicators (e.g., 'bodhi_pipeline.py')")
+    parser.add_argument('--data', help='Clean dataset (xlsx, csv, parquet or arrow)')
+    parser.add_argument('--name', help='Name of the project')
+    parser.add_argument('--only', nargs='+', metavar='INDICATOR', help='Only run these indicators (name or numbered name)')
+    parser.add_argument('--list', action='store_true', help='List the indicators of the definition module and exit')
+    parser.add_argument('--no-plots', action='store_true', help='Do not render the plots')
+    parser.add_argument('--no-tests', action='store_true', help='Do not run the statistical tests (nor save their results)')
+    parser.add_argument('--jobs', type=int, help='Number of indicators analysed in parallel')
+    parser.add_argument('--formats', nargs='+', choices=['xlsx', 'csv'], help='Formats of the tables and test results (default: xlsx)')
+    parser.add_argument('--tables', help='File path to save the tables (Excel file)')
+    parser.add_argument('--tests', help='File path to save the test results (Excel file)')
+    parser.add_argument('--folder', help='Folder (and file name prefix) to save the plots')
+    parser.add_argument('--cache', help='Folder of the result cache')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the result cache')
+    parser.add_argument('--screening', action='store_true', default=None, help='Add the chi-square screening of the indicators')
+    parser.add_argument('--monitor', metavar='LOG', help='Log the time, memory and rows of each stage and indicator (JSON lines) and print a summary')
+    parser.add_argument('--profile', metavar='FOLDER', help='Profile each stage and indicator (cProfile .prof files and tracemalloc allocation sites)')
+    parser.add_argument('--profile-modes', nargs='+', choices=['cpu', 'memory'], help='Profilers of --profile (default: cpu memory)')
+    parser.add_argument('--aggregates', metavar='DB', help='Aggregate store (SQLite): only count the new rows of the dataset and add them to the stored counts (no statistical tests)')
+    parser.add_argument('--rebuild-aggregates', action='store_true', help='Delete the stored counts of --aggregates and count all the rows again')
+    return parser
+
+
+def main(argv=None):
+    """
+    - Run the PMF of a definition module with the command-line options
+    - Return the exit code (0: finished, 1: error in the options or in the aggregate store)
+    argv: list, Command-line arguments (None: sys.argv)
+    """
+    args = parser().parse_args(argv)
+    definitions = load_definitions(args.definitions)
+    if not hasattr(definitions, 'define_indicators'):
+        print(f"{args.definitions} has no define_indicators(df) function")
+        return 1
+
+    def setting(value, name, default=None):
+        return value if value is not None else getattr(definitions, name, default)
+
+    data_path = setting(args.data, 'data_path')
+    if data_path is None:
+        print("Please give the clean dataset (--data or data_path in the definition module)")
+        return 1
+
+    import bodhi_PMF as pmf
+    from bodhi_monitor import RunMonitor, monitor_stage
+    from bodhi_dataset import dataset_schema, load_dataset, required_columns, indicator_categories, attach_dataset
+
+    # Define the indicators on the columns of the dataset, then only load the columns of the selected indicators
+    indicators = definitions.define_indicators(dataset_schema(data_path))
+    if args.list == True:
+        for indicator in indicators:
+            print(f"{indicator.indicator_name} ({indicator.s_test if indicator.s_test is not None else indicator.i_type})")
+        return 0
+    indicators, unknown = select_indicators(indicators, args.only)
+    if len(unknown) > 0:
+        print(f"Unknown indicators: {', '.join(unknown)} (see --list)")
+        return 1
+    aggregates = setting(args.aggregates, 'aggregates')
+    if aggregates is not None and args.only is not None:
+        print("--only cannot be used with the aggregate store: the counts of all the indicators are updated together")
+        return 1
+    if args.no_tests == True or aggregates is not None:
+        indicators = [indicator for indicator in indicators if indicator.s_test is None]
+    if len(indicators) == 0:
+        print("No indicators to run")
+        return 1
+
+    monitor_log = setting(args.monitor, 'monitor_log')
+    profile = setting(args.profile, 'profile_folder')
+    monitor = None
+    if monitor_log is not None or profile is not None:
+        monitor = RunMonitor(monitor_log, profile=profile, profile_modes=setting(args.profile_modes, 'profile_modes', ['cpu', 'memory']))
+    with monitor_stage(monitor, 'load', 'Dataset', path=data_path) as event:
+        df = load_dataset(data_path, columns=required_columns(indicators), categories=indicator_categories(indicators))
+        event['rows'] = len(df)
+    store = None
+    if aggregates is not None:
+        from bodhi_aggregate import AggregateStore
+        store = AggregateStore(aggregates, rebuild=args.rebuild_aggregates)
+        df = store.new_rows(df)
+        if df is None:
+            return 1
+    attach_dataset(indicators, df)
+    project = pmf.PerformanceManagementFramework(setting(args.name, 'project_name', 'Project'), getattr(definitions, 'project_type', 'Evaluation'),
+                                                 monitor=monitor)
+    project.add_indicators(indicators)
+
+    project.PMF_generation(setting(args.tables, 'file_path1', 'Statistics.xlsx'), setting(args.tests, 'file_path2', 'Test Results.xlsx'),
+                           setting(args.folder, 'folder', 'visuals/'), jobs=setting(args.jobs, 'jobs', 1),
+                           cache=None if args.no_cache == True else setting(args.cache, 'cache'),
+                           screening=setting(args.screening, 'screening', False),
+                           plots=not args.no_plots, tests=not args.no_tests, formats=args.formats, aggregates=store)
+    if store is not None:
+        store.close()
+        if len(store.errors) != 0:
+            return 1
+    return 0
+
+
+if __name__ == '__main__': # Required for running the indicators in parallel (jobs > 1)
+    sys.exit(main())
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import pandas as pd
+import numpy as np
+
+
+class SurveyCube:
+
+    def __init__(self):
+        """
+        - Initialise the survey cube class
+        - Each column is turned into category codes once, and the counts of a variable by a breakdown column are
+          computed once (one bincount) and shared by all the indicators using the same dataset in this run
+        - Indicators with a condition are counted on their rows of the shared dataset (no copy of the dataset)
+        """
+        self.frames = {} # Datasets and row positions of the cube (kept so that their ids are not reused)
+        self.codes = {}
+        self.tables = {}
+
+    def frame_key(self, df):
+        """
+        - Key of a dataset (or of the row positions of an indicator) in the cube
+        df: Dataframe, Dataset
+        """
+        key = id(df)
+        self.frames[key] = df
+        return key
+
+    def source(self, df, col):
+        """
+        - Dataset and rows of a column: df is a dataset, or an indicator (the rows of the shared dataset
+          meeting its condition, and the columns calculated for the indicator)
+        - Return the dataset holding the column and the positions of the rows (None: all the rows)
+        df: Dataframe or Indicator, Dataset
+        col: str, Column of the dataset
+        """
+        if isinstance(df, pd.DataFrame):
+            return df, None
+        if df.derived is not None and col in df.derived.columns:
+            return df.derived, None
+        return df.df, df.rows
+
+    def column_key(self, df, col):
+        """
+        - Key of a column (on some rows) in the cube
+        df: Dataframe or Indicator, Dataset
+        col: str, Column of the dataset
+        """
+        frame, rows = self.source(df, col)
+        return (self.frame_key(frame), None if rows is None else self.frame_key(rows), col)
+
+    def category_codes(self, df, col):
+        """
+        - Category codes of a column (-1: missing value)
+        - Return the codes, the categories (category order for categorical columns, order of appearance
+          for the others) and whether the column is categorical
+        - The codes of the rows of an indicator are taken from the codes of the whole column
+        df: Dataframe or Indicator, Dataset
+        col: str, Column of the dataset
+        """
+        frame, rows = self.source(df, col)
+        key = (self.frame_key(frame), None, col)
+        if key not in self.codes:
+            values = frame[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                self.codes[key] = (values.cat.codes.values.astype(np.int64), pd.Index(values.cat.categories), True)
+            else:
+                codes, categories = pd.factorize(values)
+                self.codes[key] = (codes, pd.Index(categories), False)
+        if rows is None:
+            return self.codes[key]
+
+        row_key = self.column_key(df, col)
+        if row_key not in self.codes:
+            codes, categories, categorical = self.codes[key]
+            codes = codes[rows]
+            if categorical == False:
+                # Categories observed on the rows, in their order of appearance on the rows
+                found, first = np.unique(codes[codes >= 0], return_index=True)
+                order = found[np.argsort(first)]
+                position = np.full(len(categories), -1, dtype=np.int64)
+                position[order] = np.arange(len(order))
+                codes = np.where(codes >= 0, position[codes], -1)
+                categories = categories[order]
+            self.codes[row_key] = (codes, categories, categorical)
+        return self.codes[row_key]
+
+    def counts(self, df, var, by=None):
+        """
+        - Counts of a variable (by the categories of a breakdown column)
+        - Return a series of counts by category of the variable (by = None), or a dataframe with the categories
+          of the variable as rows and the categories of the breakdown column as columns
+        - Rows and columns follow category_codes(), categories without data points are kept
+        df: Dataframe or Indicator, Dataset
+        var: str, Variable (column of the dataset)
+        by: str, Breakdown column (None: no breakdown)
+        """
+        key = ('counts', self.column_key(df, var), None if by is None else self.column_key(df, by))
+        if key not in self.tables:
+            var_codes, var_categories, var_categorical = self.category_codes(df, var)
+            if by is None:
+                valid = var_codes >= 0
+                counts = np.bincount(var_codes[valid], minlength=len(var_categories))
+                self.tables[key] = pd.Series(counts, index=var_categories, name='count')
+            else:
+                by_codes, by_categories, by_categorical = self.category_codes(df, by)
+                valid = (var_codes >= 0) & (by_codes >= 0)
+                counts = np.bincount(var_codes[valid] * len(by_categories) + by_codes[valid],
+                                     minlength=len(var_categories) * len(by_categories))
+                self.tables[key] = pd.DataFrame(counts.reshape(len(var_categories), len(by_categories)),
+                                                index=var_categories, columns=by_categories)
+        return self.tables[key]
+
+    def intersection_counts(self, df, var, by):
+        """
+        - Counts of a variable by the combinations of the categories of several breakdown columns
+        - The breakdown codes are combined into one key per data point, so the counts take one pass
+        - Return a dataframe with the observed combinations as rows (MultiIndex, sorted by category)
+          and the categories of the variable as columns
+        df: Dataframe or Indicator, Dataset
+        var: str, Variable (column of the dataset)
+        by: list, Breakdown columns
+        """
+        key = ('intersection', self.column_key(df, var), tuple(self.column_key(df, col) for col in by))
+        if key not in self.tables:
+            var_codes, var_categories, var_categorical = self.category_codes(df, var)
+            valid = var_codes >= 0
+            combined = np.zeros(len(var_codes), dtype=np.int64)
+            levels = []
+            sizes = []
+            for col in by:
+                codes, categories, categorical = self.category_codes(df, col)
+                # Rank of each category: category order for categorical columns, sorted values for the others
+                order = np.arange(len(categories)) if categorical else categories.argsort()
+                rank = np.empty(len(categories), dtype=np.int64)
+                rank[order] = np.arange(len(categories))
+                valid &= codes >= 0
+                combined = combined * len(categories) + rank[codes]
+                levels.append(categories[order])
+                sizes.append(len(categories))
+
+            keys, inverse = np.unique(combined[valid], return_inverse=True)
+            counts = np.bincount(inverse * len(var_categories) + var_codes[valid], minlength=len(keys) * len(var_categories))
+            level_codes = []
+            for size in reversed(sizes):
+                level_codes.insert(0, keys % size)
+                keys = keys // size
+            index = pd.MultiIndex(levels=levels, codes=level_codes, names=list(by))
+            self.tables[key] = pd.DataFrame(counts.reshape(len(index), len(var_categories)), index=index, columns=var_categories)
+        return self.tables[key]
+
+    def is_categorical(self, df, col):
+        """
+        - Whether a column of the dataset is categorical (its unused categories are kept in the tables)
+        df: Dataframe or Indicator, Dataset
+        col: str, Column of the dataset
+        """
+        return self.category_codes(df, col)[2]
@@ -8,66 +8,126 @@ Created on Tue Sep 17 15:04:49 2024
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MaxNLocator
-from matplotlib.patches import Patch
-from matplotlib.lines import Line2D
-import seaborn as sns
-from pandas.plotting import table
-from IPython.display import clear_output
 import warnings
-from openpyxl import load_workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.styles import Font
-from statsmodels.stats.outliers_influence import variance_inflation_factor
-from statsmodels.tools.tools import add_constant
-from scipy.stats import normaltest
-from statsmodels.stats.diagnostic import lilliefors
-import re
-import statsmodels.api as sm
-from scipy import stats
-from scipy.stats import f_oneway
-from statsmodels.formula.api import ols
 
-warnings.filterwarnings("ignore")
-plt.rcParams['figure.dpi'] = 600
+from bodhi_visual import ChartRenderer, chart_spec
+from bodhi_cube import SurveyCube
+from bodhi_indicator import condition_mask
+from bodhi_monitor import monitor_stage
+
+# scipy and statsmodels are slow to import: they are only imported by the statistical tests that use them
 
-bodhi_blue = (0.0745, 0.220, 0.396)
-bodhi_grey = (0.247, 0.29, 0.322)
-bodhi_primary_1 = (0.239, 0.38, 0.553)
-bodhi_secondary = (0.133, 0.098, 0.42)
-bodhi_tertiary = (0.047, 0.396, 0.298)
-bodhi_complement = (0.604, 0.396, 0.071)
+warnings.filterwarnings("ignore")
 
 class Data_analysis:
 
-    def __init__(self, name, indicators):
+    def __init__(self, name, indicators, cube=None, monitor=None):
         """
         - Initialise the data analysis class
 
         name: str, Name of the project
         indicators: list, List of the project indicators
+        cube: SurveyCube, Counts shared with the other indicators of the run (None: new cube)
+        monitor: RunMonitor, Run monitor measuring the calculation, tables and tests of each indicator (None: not measured)
         """
         self.name = name
         self.indicators = indicators
+        self.monitor = monitor
+        self.renderer = ChartRenderer()
+        self.cube = cube if cube is not None else SurveyCube()
+        self.ols_results = {} # OLS results by indicator name (ols_batches)
+        self.masks = {} # Masks of the clauses of the declarative conditions (condition_rows)
+        self.selections = {} # Rows meeting each condition (condition_rows)
 
-    def count(self, df, var, index_name):
+    def count(self, df, var, index_name, order=None):
         """
         - To generate a table showing the count and percentage of the indicator
-        df: Dataframe, Dataframe of this project
+        df: Dataframe or Indicator, Dataframe of this project (or the rows and calculated columns of an indicator)
         var: list, Variables related to the indicator
         index_name: str, Index name for the new count dataframe
+        order: list, Sequence of responses (all of them are shown, other responses are left out)
         """
-        count = df[var].value_counts()
+        if isinstance(var, list) and len(var) != 1:
+            data = df if isinstance(df, pd.DataFrame) else df.data(var)
+            count = data[var].value_counts()
+        else:
+            col = var[0] if isinstance(var, list) else var
+            count = self.cube.counts(df, col)
+            if order is not None:
+                count = count.reindex(order, fill_value=0)
+            elif isinstance(var, list) and self.cube.is_categorical(df, col) == False:
+                count = count.sort_index()
+            if isinstance(var, list):
+                count = pd.Series(count.values, index=pd.MultiIndex.from_arrays([count.index], names=var), name='count')
+            count = count.sort_values(ascending=False)
         count_df = pd.DataFrame({'Count': count})
         count_df['Percentage'] = round(count_df['Count'] / count_df['Count'].sum() * 100, 1)
         count_df.index.name = index_name
         return count_df
 
+    def breakdown_counts(self, df, var, col, order=None):
+        """
+        - To count the responses of the variables by the categories of a breakdown column (from the survey cube)
+        df: Dataframe or Indicator, Dataframe of this project (or the rows and calculated columns of an indicator)
+        var: list, Variables related to the indicator (their counts are added up)
+        col: str, Breakdown column
+        order: list, Sequence of responses (all of them are shown, other responses are left out)
+        """
+        variables = var if isinstance(var, list) else [var]
+        count_df = None
+        for var_ in variables:
+            table = self.cube.counts(df, var_, col)
+            count_df = table if count_df is None else count_df.add(table, fill_value=0)
+
+        if order is not None:
+            count_df = count_df.reindex(order, fill_value=0)
+        elif not all(self.cube.is_categorical(df, var_) for var_ in variables):
+            count_df = count_df[count_df.sum(axis=1) > 0].sort_index()
+        if self.cube.is_categorical(df, col) == False:
+            count_df = count_df.loc[:, count_df.sum(axis=0) > 0].sort_index(axis=1)
+        count_df = count_df.astype(np.int64)
+        count_df.index.name = 'category_value'
+        count_df.columns.name = col
+        return count_df
+
+    def intersection_table(self, df, var, intersection, order=None, change=None):
+        """
+        - To generate an intersectional breakdown table: the count and percentage of the responses for each
+          combination of the categories of several breakdown columns (from the survey cube)
+        df: Dataframe or Indicator, Dataframe of this project (or the rows and calculated columns of an indicator)
+        var: list, Variables related to the indicator (their counts are added up)
+        intersection: dic, Breakdown columns and their names: {'col1':'gender', 'col2':'region'}
+        order: list, Sequence of responses (all of them are shown, other responses are left out)
+        change: dic, New names of the responses
+        """
+        variables = var if isinstance(var, list) else [var]
+        count_df = None
+        for var_ in variables:
+            table = self.cube.intersection_counts(df, var_, list(intersection.keys()))
+            count_df = table if count_df is None else count_df.add(table, fill_value=0)
+
+        if order is not None:
+            count_df = count_df.reindex(columns=order, fill_value=0)
+        elif not all(self.cube.is_categorical(df, var_) for var_ in variables):
+            count_df = count_df.loc[:, count_df.sum(axis=0) > 0].sort_index(axis=1)
+        # Rows in the order of the levels of the cube (category order for the categorical columns, sorted values
+        # for the others), as the breakdown tables: adding the tables of several variables can reorder them
+        positions = [table.index.levels[number].get_indexer(count_df.index.get_level_values(number))
+                     for number in range(count_df.index.nlevels)]
+        count_df = count_df.iloc[np.lexsort(positions[::-1])].astype(np.int64)
+        count_df.index.names = list(intersection.values())
+        count_df.columns.name = None
+
+        percent_df = round(count_df.div(count_df.sum(axis=1), axis=0) * 100, 1)
+        f_df = pd.concat([count_df, percent_df.add_suffix('(%)')], axis=1)
+        if change is not None:
+            f_df = f_df.rename(columns={k: v for k, v in change.items() if k in f_df.columns})
+        return f_df
+
     def multi_table(self, df, columns, categories, column_labels, index_name, change = None):
         """
         - To generate a multi-table showing the count and percentage of the indicator
-        df: Dataframe, Dataframe of this project
+        df: Dataframe or Indicator, Dataframe of this project (or the rows and calculated columns of an indicator)
         columns: list, Variables related to the indicator
         categories: list, Categories of the indices
         columns_labels: list, Labels of the columns
@@ -76,7 +136,7 @@ class Data_analysis:
         """
         table = pd.DataFrame(index=categories)
         for col in columns:
-            table[col] = df[col].value_counts().reindex(categories, fill_value=0)
+            table[col] = self.cube.counts(df, col).reindex(categories, fill_value=0)
         if column_labels is not None:
             table.columns = column_labels
         if change is not None:
@@ -88,6 +148,39 @@ class Data_analysis:
             table.loc[f'{idx}(%)'] = percentage_table.loc[idx]
         return table
     
+    def answer_matrix(self, df, columns):
+        """
+        - To get the answers of the related columns as a 2-D array (rows x columns)
+        df: Dataframe, Dataframe of this project
+        columns: list, Variables related to the indicator
+        """
+        if isinstance(columns, str):
+            columns = [columns]
+        return df[columns].to_numpy(dtype=object)
+
+    def score_matrix(self, df, columns, score_map, default=0):
+        """
+        - To map the score_map over the related columns as a 2-D array (rows x columns)
+        - The score_map is only looked up once per unique answer
+        df: Dataframe, Dataframe of this project
+        columns: list, Variables related to the indicator
+        score_map: dic, Way to calculate the score for this indicator {'A':3, 'B':-1, etc}
+        default: float, Score of the answers missing from the score_map
+        """
+        answers = self.answer_matrix(df, columns)
+        codes, uniques = pd.factorize(answers.ravel())
+        scores = np.array([score_map.get(answer, default) for answer in uniques] + [default], dtype=float)
+        return scores[codes].reshape(answers.shape) # Missing answers (code -1) take the default score
+
+    def pass_fail(self, score, valid_point, index):
+        """
+        - To label each data point as 'Pass' or 'Not Pass' by comparing its score with the valid point
+        score: array, Score (or True/False response) of each data point
+        valid_point: float, Valid points for indicator calculation
+        index: index, Index of the data points
+        """
+        return pd.Series(np.where(score >= valid_point, 'Pass', 'Not Pass'), index=index, dtype=object)
+
     def ols_table(self, df, indep_col, var):
         """
         This function performs an OLS test and returns the results in a DataFrame format.
@@ -98,46 +191,158 @@ class Data_analysis:
         - indep_col (list): The independent variables
         
         Returns:
-        - pd.DataFrame: A DataFrame containing the OLS results
-        """
-        df_clean = df.dropna(subset= indep_col + var)
-        X = df_clean[indep_col]
-        Y = df_clean[var]
-        X = pd.get_dummies(data=X, drop_first=False)
-        X = X.applymap(lambda x: 1 if x == True else (0 if x == False else x))
-        X_sm = sm.add_constant(X)
-        model = sm.OLS(Y, X_sm).fit()
-        print(model.summary())
-        summary_text = model.summary().as_text()
-        lines = summary_text.split("\n")
-        header = "\n".join(lines[:2]) 
-        model_stats = lines[2:lines.index("")]
-        coeff_start = lines.index("==============================================================================")
-        coeff_end = lines.index("==============================================================================", coeff_start + 1)
-        coefficients = lines[coeff_start + 1 : coeff_end]
-        diagnostics = lines[coeff_end + 1 :]
-        model_stats_data = []
-        for line in model_stats:
-            if ": " in line:
-                metric, value = line.split(": ", 1)
-                model_stats_data.append((metric.strip(), value.strip()))
-        model_stats_df = pd.DataFrame(model_stats_data, columns=["Metric", "Value"])
-        coeff_data = []
-        for line in coefficients:
-            values = re.split(r"\s{2,}", line.strip())
-            if len(values) == 7:
-                coeff_data.append(values)
-            else:
-                print(f"Skipping line due to unexpected format: {line}")
-        
-        coeff_df = pd.DataFrame(
-            coeff_data,
-            columns=["Variable", "Coef", "Std Err", "t", "P>|t|", "[0.025", "0.975]"])
-        
-        diagnostics_df = pd.DataFrame({"Diagnostics": diagnostics})
-        return model_stats_df, coeff_df, diagnostics_df
+        - pd.DataFrame: DataFrames containing the model statistics, coefficients and diagnostics
+        """
+        outcome = var[0] if isinstance(var, list) else var
+        return self.ols_batch(df, indep_col, [outcome])[outcome]
+
+    def ols_batch(self, df, indep_col, outcomes):
+        """
+        - To fit the OLS models of several outcomes on the same independent variables
+        - The design matrix is built once, and the outcomes with the same missing values share one
+          factorisation (SVD) of the design matrix instead of fitting one model each
+        - Return the model statistics, coefficients and diagnostics of each outcome: {outcome: (df1, df2, df3)}
+        df: Dataframe, Dataset
+        indep_col: list, Independent variables (categorical variables are turned into dummy variables)
+        outcomes: list, Dependent variables (continuous variables)
+        """
+        from scipy import stats
+        from statsmodels.tools.tools import add_constant
+        X = pd.get_dummies(data=df[indep_col], drop_first=False)
+        dummies = [col for col in X.columns if X[col].dtype == bool]
+        X = X.astype({col: int for col in dummies})
+        Y = df[outcomes].astype(float)
+        valid = df[indep_col].notna().all(axis=1).values[:, None] & Y.notna().values
+
+        patterns = {}
+        for number, outcome in enumerate(outcomes):
+            patterns.setdefault(valid[:, number].tobytes(), []).append(number)
+
+        results = {}
+        for numbers in patterns.values():
+            rows = valid[:, numbers[0]]
+            design = X[rows]
+            design = design.drop(columns=[col for col in dummies if not design[col].any()]) # Categories left out with the missing values
+            design = add_constant(design)
+            x = design.values.astype(float)
+            y = Y.values[rows][:, numbers]
+            n = len(x)
+
+            u, singular, vt = np.linalg.svd(x, full_matrices=False)
+            # Dummy variables of every category are collinear with the constant: directions below the rank
+            # tolerance are left out, which gives the minimum-norm coefficients
+            kept = singular > singular.max() * max(x.shape) * np.finfo(float).eps
+            rank = int(kept.sum())
+            inverse = np.where(kept, 1 / np.where(kept, singular, 1), 0)
+            pinv = (vt.T * inverse) @ u.T
+            beta = pinv @ y
+            resid = y - x @ beta
+            ssr = (resid ** 2).sum(axis=0)
+            tss = ((y - y.mean(axis=0)) ** 2).sum(axis=0)
+            k_constant = 1 if 'const' in design.columns else 0
+            df_model = rank - k_constant
+            df_resid = n - rank
+            scale = ssr / df_resid
+            bse = np.sqrt(np.outer((pinv ** 2).sum(axis=1), scale))
+            t_values = beta / bse
+            p_values = 2 * stats.t.sf(np.abs(t_values), df_resid)
+            t_critical = stats.t.ppf(0.975, df_resid)
+
+            rsquared = 1 - ssr / tss
+            f_value = (tss - ssr) / df_model / scale
+            llf = -n / 2 * np.log(2 * np.pi) - n / 2 * np.log(ssr / n) - n / 2
+            skew = stats.skew(resid, axis=0)
+            kurtosis = stats.kurtosis(resid, axis=0, fisher=False)
+            omnibus, omnibus_p = stats.normaltest(resid, axis=0)
+            jarque_bera = n / 6 * (skew ** 2 + (kurtosis - 3) ** 2 / 4)
+            durbin_watson = (np.diff(resid, axis=0) ** 2).sum(axis=0) / ssr
+
+            for position, number in enumerate(numbers):
+                model_stats_df = pd.DataFrame([
+                    ('Dep. Variable', outcomes[number]), ('Model', 'OLS'), ('Method', 'Least Squares'),
+                    ('No. Observations', n), ('Df Residuals', df_resid), ('Df Model', df_model), ('Covariance Type', 'nonrobust'),
+                    ('R-squared', rsquared[position]), ('Adj. R-squared', 1 - (n - k_constant) / df_resid * (1 - rsquared[position])),
+                    ('F-statistic', f_value[position]), ('Prob (F-statistic)', stats.f.sf(f_value[position], df_model, df_resid)),
+                    ('Log-Likelihood', llf[position]), ('AIC', -2 * llf[position] + 2 * rank),
+                    ('BIC', -2 * llf[position] + np.log(n) * rank)], columns=["Metric", "Value"])
+                coeff_df = pd.DataFrame({'Variable': design.columns, 'Coef': beta[:, position], 'Std Err': bse[:, position],
+                                         't': t_values[:, position], 'P>|t|': p_values[:, position],
+                                         '[0.025': beta[:, position] - t_critical * bse[:, position],
+                                         '0.975]': beta[:, position] + t_critical * bse[:, position]})
+                diagnostics_df = pd.DataFrame([
+                    ('Omnibus', omnibus[position]), ('Prob(Omnibus)', omnibus_p[position]), ('Skew', skew[position]),
+                    ('Kurtosis', kurtosis[position]), ('Durbin-Watson', durbin_watson[position]),
+                    ('Jarque-Bera (JB)', jarque_bera[position]), ('Prob(JB)', stats.chi2.sf(jarque_bera[position], 2)),
+                    ('Cond. No.', singular[0] / singular[-1])], columns=["Diagnostics", "Value"])
+                results[outcomes[number]] = (model_stats_df, coeff_df, diagnostics_df)
+        return results
+
+    def ols_batches(self):
+        """
+        - To fit the OLS models of all the 'ols' indicators (results are kept in self.ols_results)
+        - Indicators on the same dataset with the same independent variables are fitted together by ols_batch()
+        """
+        batches = {}
+        for indicator in self.indicators:
+            if indicator.s_test == 'ols' and indicator.indicator_name not in self.ols_results:
+                key = (id(indicator.df), id(indicator.rows), tuple(indicator.s_group.keys()))
+                batches.setdefault(key, []).append(indicator)
+        for batch in batches.values():
+            outcomes = []
+            for indicator in batch:
+                outcome = indicator.var[0] if isinstance(indicator.var, list) else indicator.var
+                if outcome not in outcomes:
+                    outcomes.append(outcome)
+            try:
+                df = batch[0].data(list(batch[0].s_group.keys()))
+                for indicator in batch:
+                    outcome = indicator.var[0] if isinstance(indicator.var, list) else indicator.var
+                    df[outcome] = indicator.column(outcome).values
+                results = self.ols_batch(df, list(batch[0].s_group.keys()), outcomes)
+            except Exception as e:
+                print(f"Batch OLS failed, the indicators are fitted one by one: {e}")
+                continue
+            for indicator in batch:
+                outcome = indicator.var[0] if isinstance(indicator.var, list) else indicator.var
+                self.ols_results[indicator.indicator_name] = results[outcome]
+        return self.ols_results
+
+    def group_summary(self, df, col, var, numeric=False):
+        """
+        - To calculate the statistics of a variable for each category of a group column in one groupby pass
+        - Categories are in order of appearance, respondents without a category are left out
+        - Return the statistics (Mean, Std Dev, Variance, Median, Mode) by category and the values of each category
+        df: Dataframe, Dataset
+        col: str, Group column (categorical variable)
+        var: str, Variable to analyse (the first column is used when a list is given)
+        numeric: True/False, Convert the variable to numbers first (non-numeric answers are left out)
+        """
+        values = df[var]
+        if isinstance(values, pd.DataFrame):
+            values = values.iloc[:, 0]
+        if numeric == True:
+            values = pd.to_numeric(values, errors='coerce')
+        grouped = values.groupby(df[col], sort=False, observed=True)
+        summary = pd.DataFrame({'Mean': grouped.mean(), 'Std Dev': grouped.std(ddof=0),
+                                'Variance': grouped.var(ddof=0), 'Median': grouped.median()})
+        # Most frequent value of each category (the smallest one when several values are tied)
+        counts = values.groupby([df[col], values], sort=True, observed=True).size()
+        if len(counts) != 0:
+            summary['Mode'] = counts.groupby(level=0, sort=False).idxmax().map(lambda key: key[1])
+        else: summary['Mode'] = np.nan
+        summary['Mode'] = summary['Mode'].astype(object).where(summary['Mode'].notna(), None)
+        groups = [group.dropna().astype(float).values for category, group in grouped]
+        return summary, groups
+
+    def group_records(self, name, summary, test):
+        """
+        - To turn the statistics of group_summary() into the rows of a test table
+        name: str, Name of the group column
+        summary: Dataframe, Statistics by category from group_summary()
+        test: dic, Test results repeated on each row: {'p-value': 0.05}
+        """
+        return [{'Group': name, 'Category': category, **row, **test} for category, row in summary.to_dict('index').items()]
 
-    
     def anova_table(self, df, indep_col, indep_name, var):
         """
         This function performs an ANOVA test for each group and returns the results in a DataFrame format.
@@ -150,21 +355,12 @@ class Data_analysis:
         Returns:
         - pd.DataFrame: A DataFrame containing the ANOVA results (F-statistic and p-value) for each group
         """
+        from scipy import stats
         results = []
         for col, name in zip(indep_col,indep_name):
-            groups = [df[var][df[col] == group] for group in df[col].unique()]
-            groups_cleaned = [group.dropna() for group in groups]
-            f_stat, p_value = stats.f_oneway(*groups_cleaned)
-            for group in df[col].unique():
-                group_data = df[var][df[col] == group]
-                mean = float(np.mean(group_data))
-                std = float(np.std(group_data))
-                variance = float(np.var(group_data))
-                median = float(np.median(group_data))
-                mode = float(group_data.mode().iloc[0]) if not group_data.mode().empty else None
-                results.append({'Group': name,'Category': group,'Mean': mean,
-                    'Std Dev': std,'Variance': variance,'Median': median,'Mode': mode,
-                    'F-statistic': f_stat,'p-value': p_value})
+            summary, groups = self.group_summary(df, col, var)
+            f_stat, p_value = stats.f_oneway(*groups)
+            results += self.group_records(name, summary, {'F-statistic': f_stat, 'p-value': p_value})
         results_df = pd.DataFrame(results)
         return results_df
     
@@ -180,27 +376,19 @@ class Data_analysis:
         Returns:
         - pd.DataFrame: A DataFrame containing the T-test results (t-statistic and p-value) for each group
         """
+        from scipy import stats
         results = []
         for col, name in zip(indep_col,indep_name):
-            groups = [df[var][df[col] == group] for group in df[col].unique()]
-            groups_cleaned = [group.dropna().astype(float) for group in groups]
-            if len(groups_cleaned) < 2:
+            summary, groups = self.group_summary(df, col, var)
+            if len(groups) < 2:
                 raise ValueError("Insufficient valid groups for t-test.")
+            t_stat, p_value = np.nan, np.nan
             try:
-                t_stat, p_value = stats.ttest_ind(*groups_cleaned)
+                t_stat, p_value = stats.ttest_ind(*groups)
                 print(f"Column: {col}, t-statistic: {t_stat}, p-value: {p_value}")
             except TypeError as e:
                 print(f"Error in t-test for column {col}: {e}")        
-            for group in df[col].unique():
-                group_data = df[var][df[col] == group]
-                mean = float(np.mean(group_data))
-                std = float(np.std(group_data))
-                variance = float(np.var(group_data))
-                median = float(np.median(group_data))
-                mode = float(group_data.mode().iloc[0]) if not group_data.mode().empty else None
-                results.append({'Group': name,'Category': group,'Mean': mean,
-                    'Std Dev': std,'Variance': variance,'Median': median,'Mode': mode,
-                    'T-statistic': t_stat,'p-value': p_value})
+            results += self.group_records(name, summary, {'T-statistic': t_stat, 'p-value': p_value})
         results_df = pd.DataFrame(results)
         return results_df
     
@@ -216,25 +404,13 @@ class Data_analysis:
         Returns:
         - pd.DataFrame: A DataFrame containing the chi-square statistic and p-value for each group
         """
+        from scipy import stats
         results = []
         for col, name in zip(indep_col, indep_name):
             contingency_table = pd.crosstab(df[col].values.ravel(), df[var].values.ravel())
             chi2_stat, p_value, dof, expected = stats.chi2_contingency(contingency_table)
-            
-            for group in df[col].unique():
-                group_data = df[var][df[col] == group]
-                if isinstance(group_data, pd.DataFrame):
-                    group_data = group_data.iloc[:, 0]
-                group_data = pd.to_numeric(group_data, errors='coerce')
-                group_data = group_data.dropna()
-                mean = float(np.mean(group_data))
-                std = float(np.std(group_data))
-                variance = float(np.var(group_data))
-                median = float(np.median(group_data))
-                mode = float(group_data.mode().iloc[0]) if not group_data.mode().empty else None
-                results.append({'Group': name,'Category': group,'Mean': mean,
-                    'Std Dev': std,'Variance': variance,'Median': median,'Mode': mode,
-                    'Chi-Square Statistic': chi2_stat,'p-value': p_value})
+            summary, groups = self.group_summary(df, col, var, numeric=True)
+            results += self.group_records(name, summary, {'Chi-Square Statistic': chi2_stat, 'p-value': p_value})
                 
         results_df = pd.DataFrame(results)
         return results_df
@@ -248,36 +424,129 @@ class Data_analysis:
         - var (str): The variable to analyze (continuous variable)
         - indep_col (list): The variables to group by (categorical variables)
         """
+        values = df[var]
+        if isinstance(values, pd.DataFrame):
+            values = values.iloc[:, 0]
+        overall = {'Overall Mean': values.mean(), 'Overall Std Dev': values.std(ddof=0),
+                   'Overall Median': values.median(), 'Overall min': values.min(), 'Overall Max': values.max(), 'Total': values.sum()}
         results = []
         for col, name in zip(indep_col,indep_name):
-            groups = [df[var][df[col] == group] for group in df[col].unique()]
-            all_mean = np.mean(df[var]).item()
-            all_std = np.std(df[var]).item()
-            all_median = np.median(df[var]).item()
-            all_min = np.min(df[var])
-            all_max = np.max(df[var])
-            all_sum = np.sum(df[var]).item()
-            for group in df[col].unique():
-                group_data = df[var][df[col] == group]
-                mean = np.mean(group_data)
-                std = np.std(group_data).item()
-                variance = np.var(group_data).item()
-                median = np.median(group_data).item()
-                mode = group_data.mode().iloc[0] if not group_data.mode().empty else None
-                results.append({'Group': name,'Category': group,'Mean': mean,
-                    'Std Dev': std,'Variance': variance,'Median': median,'Mode': mode,
-                    'Overall Mean': all_mean, 'Overall Std Dev': all_std,
-                    'Overall Median': all_median, 'Overall min': all_min, 'Overall Max': all_max, 'Total': all_sum})
+            summary, groups = self.group_summary(df, col, var)
+            results += self.group_records(name, summary, overall)
         results_df = pd.DataFrame(results)
         return results_df
     
-    def statistical_test(self, file_path, folder):
+    def chi2_batch(self, tables):
+        """
+        - To run chi-square tests of independence on many contingency tables at once
+        - The tables are stacked into one zero-padded array (same results as stats.chi2_contingency,
+          with the Yates correction for tables with one degree of freedom)
+        - Return the chi-square statistics, degrees of freedom, p-values, number of data points and Cramer's V
+        tables: list, Contingency tables (2D arrays of counts)
+        """
+        from scipy import stats
+        observed = np.zeros((len(tables), max(table.shape[0] for table in tables), max(table.shape[1] for table in tables)))
+        for number, table in enumerate(tables):
+            observed[number, :table.shape[0], :table.shape[1]] = table
+        row_sum = observed.sum(axis=2)
+        col_sum = observed.sum(axis=1)
+        n = row_sum.sum(axis=1)
+        expected = row_sum[:, :, None] * col_sum[:, None, :] / np.maximum(n, 1)[:, None, None]
+        dof = np.maximum((row_sum > 0).sum(axis=1) - 1, 0) * np.maximum((col_sum > 0).sum(axis=1) - 1, 0)
+
+        diff = np.abs(observed - expected)
+        corrected = np.where((dof == 1)[:, None, None], np.maximum(diff - 0.5, 0), diff)
+        cells = expected > 0
+        safe_expected = np.where(cells, expected, 1)
+        chi2_stat = np.where(cells, corrected ** 2 / safe_expected, 0).sum(axis=(1, 2))
+        uncorrected = np.where(cells, diff ** 2 / safe_expected, 0).sum(axis=(1, 2))
+        p_value = np.where(dof > 0, stats.chi2.sf(chi2_stat, np.maximum(dof, 1)), np.nan)
+
+        smaller = np.minimum((row_sum > 0).sum(axis=1), (col_sum > 0).sum(axis=1)) - 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cramers_v = np.where((smaller > 0) & (n > 0), np.sqrt(uncorrected / (np.maximum(n, 1) * np.maximum(smaller, 1))), np.nan)
+        return chi2_stat, dof, p_value, n, cramers_v
+
+    def screening(self, correction='holm', alpha=0.05):
+        """
+        - To test every categorical indicator (without a statistical test) against every breakdown column declared by
+          the indicators with add_breakdown() (chi-square tests of all the pairs, a column is not paired with itself)
+        - Contingency tables are counted from the category codes of the survey cube with one bincount per pair, and the p-values
+          are adjusted for multiple comparisons (Holm and Benjamini-Hochberg)
+        - Return one table of all the pairs, ranked by p-value
+        correction: str, Adjusted p-value deciding the significance ('holm' or 'bh')
+        alpha: float, Significance level
+        """
+        from statsmodels.stats.multitest import multipletests
+        breakdowns = {} # Breakdown columns of all the indicators (the first name given to a column is used)
+        for indicator in self.indicators:
+            for col, name in (indicator.breakdown or {}).items():
+                breakdowns.setdefault(col, name)
+        records = []
+        tables = []
         for indicator in self.indicators:
+            if indicator.s_test is not None:
+                continue
+            variables = [indicator.var] if isinstance(indicator.var, str) else list(indicator.var)
+            for var in variables:
+                for col, name in breakdowns.items():
+                    if col == var:
+                        continue
+                    try:
+                        var_codes, var_categories, var_categorical = self.cube.category_codes(indicator, var)
+                        col_codes, col_categories, col_categorical = self.cube.category_codes(indicator, col)
+                    except KeyError as e:
+                        print(f"[SKIPPED] Missing column {e} in the screening of indicator '{indicator.name}'")
+                        continue
+                    var_count, col_count = len(var_categories), len(col_categories)
+                    valid = (var_codes >= 0) & (col_codes >= 0)
+                    table = np.bincount(var_codes[valid] * col_count + col_codes[valid], minlength=var_count * col_count)
+                    table = table.reshape(var_count, col_count)
+                    tables.append(table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0])
+                    records.append({'Indicator': indicator.indicator_name, 'Variable': var, 'Breakdown': name})
+
+        columns = ['Indicator', 'Variable', 'Breakdown', 'N', 'Chi-Square Statistic', 'Degrees of Freedom', 'p-value',
+                   'Holm p-value', 'BH p-value', "Cramer's V", 'Significant']
+        if len(tables) == 0:
+            return pd.DataFrame(columns=columns)
+        chi2_stat, dof, p_value, n, cramers_v = self.chi2_batch(tables)
+        holm = np.full(len(p_value), np.nan)
+        bh = np.full(len(p_value), np.nan)
+        tested = ~np.isnan(p_value)
+        if tested.any():
+            holm[tested] = multipletests(p_value[tested], method='holm')[1]
+            bh[tested] = multipletests(p_value[tested], method='fdr_bh')[1]
+
+        results_df = pd.DataFrame(records)
+        results_df['N'] = n.astype(int)
+        results_df['Chi-Square Statistic'] = chi2_stat
+        results_df['Degrees of Freedom'] = dof
+        results_df['p-value'] = p_value
+        results_df['Holm p-value'] = holm
+        results_df['BH p-value'] = bh
+        results_df["Cramer's V"] = cramers_v
+        adjusted = holm if correction == 'holm' else bh
+        results_df['Significant'] = np.where(adjusted < alpha, 'Yes', 'No')
+        results_df = results_df.sort_values(['p-value', 'Chi-Square Statistic'], ascending=[True, False], na_position='last', kind='stable')
+        results_df.index = pd.RangeIndex(1, len(results_df) + 1, name='Rank')
+        return results_df[columns]
+
+    def statistical_test(self, report, folder):
+        """
+        - To run the statistical tests of the indicators and collect the results
+        report: ReportWriter, Report writer collecting the test results
+        folder: str, Folder where plots will be saved
+        """
+        self.ols_batches()
+        for indicator in self.indicators:
+            if indicator.s_test is None:
+                continue
             try:
-                if indicator.s_test is not None:
+                with monitor_stage(self.monitor, 'tests', indicator.indicator_name, test=indicator.s_test) as event:
                     sheet_name = indicator.indicator_name
                     var_name = indicator.description
-                    df = indicator.df
+                    df = indicator.data()
+                    event['rows'] = len(df)
                     var = indicator.var
                     indep_col = list(indicator.s_group.keys())
                     indep_name = list(indicator.s_group.values())
@@ -291,63 +560,41 @@ class Data_analysis:
                     elif indicator.s_test == 'stats':
                         s_df = self.stats_table(df, indep_col, indep_name, var)
                     elif indicator.s_test == 'ols':
-                        model_stats_df, coeff_df, diagnostics_df = self.ols_table(df, indep_col, var)
-                        
-                    with pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
-                        if indicator.s_test == 'ols':
-                            model_stats_df.to_excel(writer, sheet_name=sheet_name, index=True, header=True)
-                            startrow = model_stats_df.shape[0] + 2
-                            coeff_df.to_excel(writer, sheet_name=sheet_name, startrow=startrow, index=True, header=True)
-                            startrow = coeff_df.shape[0] + 2
-                            diagnostics_df.to_excel(writer, sheet_name=sheet_name, startrow=startrow, index=True, header=True)
-                        else: s_df.to_excel(writer, sheet_name=sheet_name, index=True, header=True)
+                        if indicator.indicator_name in self.ols_results:
+                            model_stats_df, coeff_df, diagnostics_df = self.ols_results[indicator.indicator_name]
+                        else: model_stats_df, coeff_df, diagnostics_df = self.ols_table(df, indep_col, var)
                         
-                    wb = load_workbook(file_path)
-                    ws = wb[sheet_name]
-                    ws.insert_rows(1)
-                    ws['B1'] = var_name
-                    ws['B1'].font = Font(bold=True)
-                    for column in ws.columns:
-                        max_length = 0
-                        column_letter = column[0].column_letter
-                        for cell in column:
-                            try:
-                                if cell.value:
-                                    max_length = max(max_length, len(str(cell.value)))
-                            except:
-                                pass
-                        adjusted_width = (max_length + 2)
-                        ws.column_dimensions[column_letter].width = adjusted_width
-            
-                    wb.save(file_path)
+                    if indicator.s_test == 'ols':
+                        blocks = [(model_stats_df, {'index': True, 'header': True}),
+                                  (coeff_df, {'index': True, 'header': True}),
+                                  (diagnostics_df, {'index': True, 'header': True})]
+                    else: blocks = [(s_df, {'index': True, 'header': True})]
+                    report.add_sheet(sheet_name, blocks, description=var_name)
             except Exception as e:
                 print(f"Unexpected error statistically processing indicator {indicator.name}: {e}")
             
 
-    def tables(self, indicator, var, sheet_name, var_name, file_path, folder):
+    def tables(self, indicator, var, sheet_name, var_name, report, folder):
         """
         - To generate tables including both general and breakdown data and related plots
-        file_path: str, Directory where tables files will be saved
+        report: ReportWriter, Report writer collecting the tables
         folder: str, Folder where plots will be saved
         """        
-        df = indicator.df.copy(deep=True)
+        df = indicator # Counted on the rows of the shared dataset used by the indicator (no copy)
         if indicator.s_test is None:
             if indicator.breakdown != None:
                 dis_cols = list(indicator.breakdown.keys())
             else: dis_cols = None
             dfs = {}
-            book = load_workbook(file_path)
-                
-            try:
-                if indicator.var_order is not None:
-                    for var_ in var:
-                        df[var_] = df[var_].astype('category')
-                        df[var_] = df[var_].cat.set_categories(indicator.var_order, ordered=True)
-            except (KeyError, ValueError) as e:
-                print("")
+
+            # Counts come from the survey cube shared by the indicators, the sequence of responses is applied to them
+            order = indicator.var_order
+            if order is not None and len(set(order)) != len(order):
+                print(f"{indicator.indicator_name} has repeated responses in its sequence of responses, which is not applied")
+                order = None
                 
             if indicator.var_type == 'single':
-                overall_df = self.count(df, var, index_name=indicator.indicator_name)
+                overall_df = self.count(df, var, index_name=indicator.indicator_name, order=order)
                 if indicator.visual == True:
                     self.plot_bar(indicator, overall_df, folder) 
                         
@@ -362,11 +609,9 @@ class Data_analysis:
                     
             if dis_cols is not None:
                 try:
-                    melted = df.melt(id_vars=dis_cols, value_vars=var, var_name=' ', value_name='category_value')
-            
                     for col in dis_cols:
                         try:
-                            count_df = melted.groupby(['category_value', col]).size().unstack(fill_value=0)
+                            count_df = self.breakdown_counts(df, var, col, order)
             
                             if indicator.visual is True and indicator.var_type != 'multi':
                                 self.breakdown_count_bar(indicator, count_df, col, folder)
@@ -397,31 +642,19 @@ class Data_analysis:
                 except Exception as e:
                     print(f"[FATAL] Failed to process indicator '{indicator.name}': {e}")
                 
-            with pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
-                if dis_cols != None:
-                    final_df.to_excel(writer, sheet_name=sheet_name, merge_cells=False, index=True, header=True)
-                    startrow = final_df.shape[0] + 2
-                    overall_df.to_excel(writer, sheet_name=sheet_name, startrow=startrow, index=True, header=True)
-                else: overall_df.to_excel(writer, sheet_name=sheet_name, index=True, header=True)
-                    
-            wb = load_workbook(file_path)
-            ws = wb[sheet_name]
-            ws.insert_rows(1)
-            ws['B1'] = indicator.description
-            ws['B1'].font = Font(bold=True)
-            for column in ws.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
+            if dis_cols != None:
+                blocks = [(final_df, {'merge_cells': False, 'index': True, 'header': True}),
+                          (overall_df, {'index': True, 'header': True})]
+            else: blocks = [(overall_df, {'index': True, 'header': True})]
+
+            if indicator.intersections is not None:
+                for intersection in indicator.intersections:
                     try:
-                        if cell.value:
-                            max_length = max(max_length, len(str(cell.value)))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2)
-                ws.column_dimensions[column_letter].width = adjusted_width
-        
-            wb.save(file_path)
+                        intersection_df = self.intersection_table(df, var, intersection, order, indicator.var_change)
+                        blocks.append((intersection_df, {'merge_cells': False, 'index': True, 'header': True}))
+                    except Exception as e:
+                        print(f"[SKIPPED] Intersection {' x '.join(intersection.values())} for indicator '{indicator.name}': {e}")
+            report.add_sheet(sheet_name, blocks, description=indicator.description)
 
     def calculation(self, indicator, method):
         """
@@ -441,19 +674,25 @@ class Data_analysis:
                 8. 'score_select_anyyes': Check if at least one of the related columns was answered with "Yes"
                 9. 'score_select_anyno': Check if at least one of the related columns was answered with "No"
                 10. 'score_select_manual': Manual Code for multiple selecting
+        - The calculated column is kept in indicator.derived (rows of the indicator), the shared dataset is not changed
         """
-        df = indicator.df
+        manual_groups = [['col1', 'col2', 'col3', 'col4'], ['col5', 'col6']] # Groups of columns for 'score_select_manual'
+        if method == "score_select_manual":
+            df = indicator.data(manual_groups[0] + manual_groups[1])
+        else: df = indicator.data(indicator.var)
+        rows = np.arange(len(indicator.df)) if indicator.rows is None else indicator.rows
         variable = indicator.name
 
         if method == "score":
             if indicator.score_map != None:
-                df['score'] = df[indicator.var].map(indicator.score_map)
-                df[variable] = df['score'].apply(lambda x: 'Pass' if x >= indicator.valid_point else 'Not Pass')
-                df.drop(columns=['score'], inplace = True)
-            else: df[variable] = df[indicator.var].apply(lambda x: 'Pass' if x >= indicator.valid_point else 'Not Pass')
+                score = self.score_matrix(df, indicator.var, indicator.score_map, default=np.nan)[:, 0]
+            else: score = self.answer_matrix(df, indicator.var)[:, 0]
+            df[variable] = self.pass_fail(score, indicator.valid_point, df.index)
 
         elif method == "divide":
-            df = df.dropna(subset=indicator.var)
+            valid = df[indicator.var].notna().all(axis=1).values if isinstance(indicator.var, list) else df[indicator.var].notna().values
+            df = df[valid]
+            rows = rows[valid]
             
             def apply_valid_points(df, var, valid_points):
                 if var[0] not in df.columns:
@@ -488,89 +727,82 @@ class Data_analysis:
             
         elif method == "score_average":
             if indicator.score_map != None:
-                def scoring(row):
-                    score = 0
-                    columns = indicator.var
-                    for col in columns:
-                        value = row[col]
-                        score += indicator.score_map.get(value, 0)
-                    return score / len(columns)
-                df['score'] = df.apply(scoring, axis=1)
-                df[variable] = df['score'].apply(lambda x: 'Pass' if x >= indicator.valid_point else 'Not Pass')
-                df.drop(columns=['score'], inplace = True)
+                score = self.score_matrix(df, indicator.var, indicator.score_map).mean(axis=1)
+                df[variable] = self.pass_fail(score, indicator.valid_point, df.index)
             else: print("Please assign the score map for calculation")
 
         elif method == "score_sum":
             if indicator.score_map != None:
-                def scoring(row):
-                    score = 0
-                    columns = indicator.var
-                    for col in columns:
-                        score += indicator.score_map.get(row[col], 0)
-                    return score
-                df['score'] = df.apply(scoring, axis=1)
-                df[variable] = df['score'].apply(lambda x: 'Pass' if x >= indicator.valid_point else 'Not Pass')
-                df.drop(columns=['score'], inplace = True)
+                score = self.score_matrix(df, indicator.var, indicator.score_map).sum(axis=1)
+                df[variable] = self.pass_fail(score, indicator.valid_point, df.index)
             else: print("Please assign the score map for calculation")
 
-            
         elif method == "score_select_allyes":
-            df['response'] = df.apply(lambda row: all(row[var] == 'Yes' for var in indicator.var), axis=1)
-            df[variable] = df['response'].apply(lambda x: 'Pass' if x else 'Not Pass')
-            df.drop(columns=['response'], inplace = True)
+            response = (self.answer_matrix(df, indicator.var) == 'Yes').all(axis=1)
+            df[variable] = self.pass_fail(response, True, df.index)
 
         elif method == "score_select_allno":
-            df['response'] = df.apply(lambda row: all(row[var] == 'No' for var in indicator.var), axis=1)
-            df[variable] = df['response'].apply(lambda x: 'Pass' if x else 'Not Pass')
-            df.drop(columns=['response'], inplace = True)
+            response = (self.answer_matrix(df, indicator.var) == 'No').all(axis=1)
+            df[variable] = self.pass_fail(response, True, df.index)
 
-        elif method == "score_select_anyyes":
-            df['response'] = df.apply(lambda row: any(row[var] == 'Yes' for var in indicator.var), axis=1)
-            df[variable] = df['response'].apply(lambda x: 'Pass' if x else 'Not Pass')
-            df.drop(columns=['response'], inplace = True)
+        elif method == "score_select_anyyes":
+            response = (self.answer_matrix(df, indicator.var) == 'Yes').any(axis=1)
+            df[variable] = self.pass_fail(response, True, df.index)
 
         elif method == "score_select_anyno":
-            df['response'] = df.apply(lambda row: any(row[var] == 'No' for var in indicator.var), axis=1)
-            df[variable] = df['response'].apply(lambda x: 'Pass' if x else 'Not Pass')
-            df.drop(columns=['response'], inplace = True)
+            response = (self.answer_matrix(df, indicator.var) == 'No').any(axis=1)
+            df[variable] = self.pass_fail(response, True, df.index)
 
         elif method == "score_select_manual":
-            def scoring(row):
-                score = 0
-                for col in ['col1', 'col2', 'col3', 'col4']:
-                    if row[col] == 'Yes': # Assign and adjust the response for +1 score
-                        score += 1 # Please adjust this score
-                    elif row[col] == 'No': # Assign the response for -1 score
-                        score -= 1 # Please adjust this score
-                for col in ['col5', 'col6']: # Assign the response for +1 score
-                    if row[col] == 'No':
-                        score += 1 # Please adjust this score
-                return score
-            df['score'] = df.apply(scoring, axis=1)
-            df[variable] = df['score'].apply(lambda x: 'Pass' if x >= indicator.valid_point else 'Not Pass')
-            df.drop(columns=['score'], inplace = True)        
+            # Assign and adjust the responses (and their scores) for each group of columns
+            score = self.score_matrix(df, manual_groups[0], {'Yes': 1, 'No': -1}).sum(axis=1)
+            score = score + self.score_matrix(df, manual_groups[1], {'No': 1}).sum(axis=1)
+            df[variable] = self.pass_fail(score, indicator.valid_point, df.index)
         
         indicator.var = variable
-        indicator.df = df
         indicator.var_type = 'single'
             
         if indicator.var_change is not None:
             df[variable] = df[variable].replace(indicator.var_change)
+        indicator.rows = None if len(rows) == len(indicator.df) else rows
+        indicator.derived = df[[variable]] if variable in df.columns else None
             
+    def condition_rows(self, df, condition):
+        """
+        - To get the positions of the rows of the dataset meeting a condition
+        - Each declarative condition (and each of its clauses) is evaluated once per run, boolean series once per series
+        df: Dataframe, Dataset
+        condition: series or tuple, Condition of the indicator (boolean series or canonical condition spec)
+        """
+        spec = isinstance(condition, tuple)
+        key = (id(df), condition if spec else id(condition))
+        if key not in self.selections:
+            if spec:
+                mask = np.ones(len(df), dtype=bool)
+                for clause in condition:
+                    clause_key = (id(df), clause)
+                    if clause_key not in self.masks:
+                        self.masks[clause_key] = condition_mask(df, clause)
+                    mask = mask & self.masks[clause_key]
+            else: mask = pd.Series(condition).reindex(df.index).fillna(False).to_numpy(dtype=bool)
+            self.selections[key] = (df, condition, np.flatnonzero(mask)) # The dataset and the series are kept so that their ids are not reused
+        return self.selections[key][2]
+
     def indicator_analysis(self):
         """
         - To run the calculation function for all indicators
+        - Indicators with a condition keep the positions of their rows of the shared dataset instead of a copy
+          (indicators with the same condition share them)
         """         
         for indicator in self.indicators:
-            if indicator.condition is None:
-                df_copy = indicator.df
-            else:
-                df_copy = indicator.df
-                df_copy = df_copy[indicator.condition]
-            
-            indicator.df = df_copy
-            if indicator.i_cal != None:
-                self.calculation(indicator, indicator.i_cal)
+            with monitor_stage(self.monitor, 'calculation', indicator.indicator_name, method=indicator.i_cal) as event:
+                if indicator.condition is None:
+                    indicator.rows = None
+                else: indicator.rows = self.condition_rows(indicator.df, indicator.condition)
+
+                if indicator.i_cal != None:
+                    self.calculation(indicator, indicator.i_cal)
+                event['rows'] = len(indicator.df) if indicator.rows is None else len(indicator.rows)
         return print("All indicators have been calculated")
         
     def breakdown_count_bar(self, indicator, df, colname, file_path, figsize=(12, 8), rotation=0, fontsize=12):
@@ -585,62 +817,13 @@ class Data_analysis:
         fontsize: int, Font size for plots
         """         
         breakdown = indicator.breakdown[colname]
-        palette = [bodhi_complement, bodhi_blue, bodhi_tertiary, bodhi_primary_1, bodhi_grey, bodhi_secondary]
-        if indicator.var_order != None:
-            df = df.loc[indicator.var_order]
-        ax = df.plot(kind='bar', stacked=False, width=0.6, figsize=figsize, color=palette)
-        title = f'{indicator.description}\nby {breakdown}'
-        output_file = f'{file_path}_{indicator.indicator_name}_{breakdown}_count.png'
-        
-        ax.set_ylabel('Count')
-        ax.set_title(title)
-        column_totals = df.sum(axis=0)
-        
-        bar_width = ax.patches[0].get_width()
-        fontsize_auto = max(fontsize * (bar_width / 0.85), 8)
-        
-        for i, column in enumerate(df.columns):
-            for j in range(len(df)):
-                bar_index = i * len(df) + j
-                bar = ax.patches[bar_index]
-                bar_x = bar.get_x() + bar.get_width() / 2
-                bar_height = bar.get_height()
-                value = df[column].iloc[j]
-                percentage = (value / column_totals[column]) * 100
-                text = f'{value}\n({percentage:.1f}%)'
-                ax.text(bar_x, bar_height, text, ha='center', va='bottom', fontsize=fontsize_auto)
-
-        if indicator.i_type == 'Count' :          
-            if indicator.target is not None:
-               ax.axhline(y=indicator.target, color='red', linestyle='--', linewidth=0.5, label='Target')
-            if indicator.baseline is not None:
-                ax.axhline(y=indicator.baseline, color='blue', linestyle='--', linewidth=0.5, label='Baseline')
-            if indicator.midline is not None:
-                ax.axhline(y=indicator.midline, color='green', linestyle='--', linewidth=0.5,  label='Midline')
-
-        def replace_spaces(text):
-            delimiters = [' ', '/']
-            if len(text) >= 13:
-                spaces = [i for i, char in enumerate(text) if char in delimiters]
-                if len(spaces) >= 3:
-                    text = text[:spaces[0]] + '\n' + text[spaces[0] + 1:spaces[2]] + '\n' + text[spaces[2] + 1:]
-                elif len(spaces) >= 1:
-                    text = text[:spaces[0]] + '\n' + text[spaces[0]+1:]
-            return text
-        
-        plt.title(title, fontsize=fontsize + 4)
-        plt.xlabel(" ", fontsize=fontsize)
-        plt.ylabel("Count", fontsize = fontsize)
-        df.index = df.index.map(lambda x: x if isinstance(x, str) else ''.join(x))
-        labels = [''.join(label) if isinstance(label, tuple) else label for label in df.index]
-        labels = [replace_spaces(label) for label in labels]
-        ax.set_xticklabels(labels, rotation=rotation, fontsize=fontsize)
-        plt.legend(title=f'{breakdown} and Target', fontsize=fontsize-1)
-        max_height = df.max().max()
-        plt.ylim(0, max_height * 1.1)
-        ax.yaxis.set_major_locator(MaxNLocator(integer=True))
-        plt.savefig(output_file, bbox_inches='tight', dpi=800)
-        plt.close()
+        lines = {}
+        if indicator.i_type == 'Count':
+            lines = {'target': indicator.target, 'baseline': indicator.baseline, 'midline': indicator.midline}
+        spec = chart_spec('count', df, f'{indicator.description}\nby {breakdown}',
+                          f'{file_path}_{indicator.indicator_name}_{breakdown}_count.png', indicator.i_type,
+                          var_order=indicator.var_order, breakdown=breakdown, figsize=figsize, rotation=rotation, fontsize=fontsize, **lines)
+        self.renderer.submit(spec)
 
     def breakdown_percentage_bar(self, indicator, df, colname, file_path, figsize=(12, 8), rotation=0, fontsize=12):
         """
@@ -654,51 +837,13 @@ class Data_analysis:
         fontsize: int, Font size for plots
         """      
         breakdown = indicator.breakdown[colname]
-        palette = [bodhi_complement, bodhi_blue, bodhi_tertiary, bodhi_primary_1, bodhi_grey, bodhi_secondary]
-        if indicator.var_order != None:
-            df = df.loc[indicator.var_order]
-        ax = df.plot(kind='bar', stacked=False, width=0.6, figsize=figsize, color=palette)
-        title = f'{indicator.description}\nby {breakdown}'
-        output_file = f'{file_path}_{indicator.indicator_name}_{breakdown}_percent.png'
-        
-        ax.set_ylabel('Percentage')
-        ax.set_title(title)
-        bar_width = ax.patches[0].get_width()
-        fontsize_auto = max(fontsize * (bar_width / 0.85), 8)
-        for i in ax.containers:
-            ax.bar_label(i, labels=[f'{p:.0f}%' for p in df[i.get_label()]], label_type='edge', fontsize=fontsize_auto)
-            
-        if indicator.i_type == 'Percentage' :          
-            if indicator.target is not None:
-               ax.axhline(y=indicator.target, color='red', linestyle='--', linewidth=0.5, label='Target')
-            if indicator.baseline is not None:
-                ax.axhline(y=indicator.baseline, color='blue', linestyle='--', linewidth=0.5, label='Baseline')
-            if indicator.midline is not None:
-                ax.axhline(y=indicator.midline, color='green', linestyle='--', linewidth=0.5,  label='Midline')
-                
-        def replace_spaces(text):
-            delimiters = [' ', '/']
-            if len(text) >= 13:
-                spaces = [i for i, char in enumerate(text) if char in delimiters]
-                if len(spaces) >= 3:
-                    text = text[:spaces[0]] + '\n' + text[spaces[0] + 1:spaces[2]] + '\n' + text[spaces[2] + 1:]
-                elif len(spaces) >= 1:
-                    text = text[:spaces[0]] + '\n' + text[spaces[0]+1:]
-            return text
-    
-        plt.title(title, fontsize=fontsize + 4)
-        plt.xlabel(" ", fontsize=fontsize)
-        plt.ylabel("Percentage", fontsize = fontsize)
-        plt.ylim(0, 105)
-        plt.yticks([0, 20, 40, 60, 80, 100])
-        df.index = df.index.map(lambda x: x if isinstance(x, str) else ''.join(x))
-        labels = [''.join(label) if isinstance(label, tuple) else label for label in df.index]
-        labels = [replace_spaces(label) for label in labels]
-        ax.set_xticklabels(labels, rotation=rotation, fontsize=fontsize)
-        plt.xticks(rotation=rotation, fontsize=fontsize)
-        plt.legend(title=f'{breakdown} and Target', fontsize=fontsize-1)
-        plt.savefig(output_file, bbox_inches='tight', dpi=800)
-        plt.close()
+        lines = {}
+        if indicator.i_type == 'Percentage':
+            lines = {'target': indicator.target, 'baseline': indicator.baseline, 'midline': indicator.midline}
+        spec = chart_spec('percentage', df, f'{indicator.description}\nby {breakdown}',
+                          f'{file_path}_{indicator.indicator_name}_{breakdown}_percent.png', indicator.i_type,
+                          var_order=indicator.var_order, breakdown=breakdown, figsize=figsize, rotation=rotation, fontsize=fontsize, **lines)
+        self.renderer.submit(spec)
 
     def plot_bar(self, indicator, df_, file_path, figsize=(12, 8), rotation=0, fontsize=12):
         """
@@ -710,92 +855,32 @@ class Data_analysis:
         rotation: int, Rotation angle for the x-axis ticks
         fontsize: int, Font size for plots
         """      
-        title = indicator.description
-        output_file = f'{file_path}_{indicator.indicator_name}.png'
-        palette = [bodhi_complement, bodhi_blue, bodhi_tertiary, bodhi_primary_1, bodhi_grey, bodhi_secondary]
-        if indicator.var_order != None:
-            df_ = df_.loc[indicator.var_order]
-        df_.dropna(subset=['Count', 'Percentage'], inplace=True)
-        fig, ax = plt.subplots(figsize=figsize)
-        if indicator.i_type == 'Count':
-            df2 = df_['Count']
-            df2.plot(kind='bar', color=palette, figsize=figsize, ax = ax)
-            bars = ax.patches
-            total = df_['Count'].values.sum()
-            for bar in bars:
-                height = bar.get_height()
-                percentage = (height / total) * 100
-                ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height(), 
-                     f'{height:.0f} ({percentage:.1f}%)',
-                     ha='center', va='bottom', fontsize=fontsize+2)
-            max_height = df_.max().max()
-            ax.yaxis.set_major_locator(MaxNLocator(integer=True))
-            plt.ylim(0, max_height * 1.1)
-            
-        elif indicator.i_type == 'Percentage':
-            df_['Percentage'].plot(kind='bar', color=palette, figsize=figsize, ax = ax)
-            bars = ax.patches
-            for bar, (idx, row) in zip(bars, df_.iterrows()):
-                percentage = row['Percentage']
-                count = row['Count']
-                label = f'{percentage:.1f}% ({int(count)})'
-                ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height(), label,ha='center', va='bottom', fontsize=fontsize + 2)
-            plt.ylim(0, 105)
-            plt.yticks([0, 20, 40, 60, 80, 100])
-
-        if indicator.target is not None:
-            ax.axhline(y=indicator.target, color='red', linestyle='--', linewidth=0.5, label='Target')
-            
-        if indicator.baseline is not None:
-            ax.axhline(y=indicator.baseline, color='blue', linestyle='--', linewidth=0.5, label='Baseline')
-            
-        if indicator.midline is not None:
-            ax.axhline(y=indicator.midline, color='green', linestyle='--', linewidth=0.5,  label='Midline')
-            
-        df_.index = df_.index.map(lambda x: x if isinstance(x, str) else ''.join(x))
-        labels = [''.join(label) if isinstance(label, tuple) else label for label in df_.index]
-
-        def replace_spaces(text):
-            delimiters = [' ', '/']
-            if len(text) >= 13:
-                spaces = [i for i, char in enumerate(text) if char in delimiters]
-                if len(spaces) >= 3:
-                    text = text[:spaces[0]] + '\n' + text[spaces[0] + 1:spaces[2]] + '\n' + text[spaces[2] + 1:]
-                elif len(spaces) >= 1:
-                    text = text[:spaces[0]] + '\n' + text[spaces[0]+1:]
-            return text
-
-        labels = [replace_spaces(label) for label in labels]
-        plt.title(title, fontsize=fontsize + 4)
-        plt.xlabel(" ", fontsize=fontsize)
-        plt.ylabel(indicator.i_type, fontsize = fontsize)
-        ax.set_xticks(range(len(labels)))
-        ax.set_xticklabels(labels, rotation=rotation, fontsize=fontsize)
-        bar_handles = [Patch(color=palette[i], label=label) for i, label in enumerate(labels)]
-        line_handles, _ = ax.get_legend_handles_labels()
-        handles = bar_handles + line_handles[:-1]
-        ax.legend(handles=handles, title="Category", loc='best')
-        plt.savefig(output_file, bbox_inches='tight', dpi=800)
-        plt.close()
+        spec = chart_spec('bar', df_, indicator.description, f'{file_path}_{indicator.indicator_name}.png', indicator.i_type,
+                          target=indicator.target, baseline=indicator.baseline, midline=indicator.midline,
+                          var_order=indicator.var_order, figsize=figsize, rotation=rotation, fontsize=fontsize)
+        self.renderer.submit(spec)
         
-    def evaluation(self, file_path, folder):
+    def evaluation(self, report, folder):
         """
         - Function to run the kap_tables function for each indicator or question
-        file_path: str, Directory where tables files will be saved
+        report: ReportWriter, Report writer collecting the tables
         folder: str, Folder where plots will be saved
         """
         for indicator in self.indicators:
             print(f'{indicator.name} analysis starts')
             try:
+                rows = len(indicator.df) if indicator.rows is None else len(indicator.rows)
                 if indicator.var_type == 'single':
                    sheet_name = f"{indicator.indicator_name}"
                    var_name = f"{indicator.number}" 
-                   self.tables(indicator, indicator.var, sheet_name, var_name, file_path, folder)
+                   with monitor_stage(self.monitor, 'tables', sheet_name, rows, indicator=indicator.indicator_name):
+                       self.tables(indicator, indicator.var, sheet_name, var_name, report, folder)
                 elif indicator.var_type == 'multi':
                     names = range(len(indicator.var))
                     for var, i in zip(indicator.var, names):
                         sheet_name = f"{indicator.indicator_name}-{i}"
                         var_name = f"{indicator.number}-{i}"
-                        self.tables(indicator, var, sheet_name, var_name, file_path, folder)
+                        with monitor_stage(self.monitor, 'tables', sheet_name, rows, indicator=indicator.indicator_name):
+                            self.tables(indicator, var, sheet_name, var_name, report, folder)
             except Exception as e:
                 print(f"Unexpected error processing indicator {indicator.name}: {e}")
@@ -10,16 +10,22 @@ Please download following Python Libraries:
 2. Numpy
 3. uuid
 4. openpyxl
+5. pyarrow (for the Parquet and Arrow formats)
 """
 
 import pandas as pd
 import numpy as np
 import uuid
-from openpyxl import load_workbook
+import hashlib
+import json
+import os
+from bodhi_dataset import save_dataset, load_dataset, columnar_types
+from bodhi_monitor import monitor_stage
 
 class Preprocessing:
     
-    def __init__(self, name, file_path, file_path_others, list_del_cols, dates, miss_col, identifiers, cols_new, del_type = 0, file_type='xlsx'):
+    def __init__(self, name, file_path, file_path_others, list_del_cols, dates, miss_col, identifiers, cols_new, del_type = 0, file_type='xlsx', save_type=None, categories=None, checkpoint=None,
+                 multi_select=None, value_maps=None, chunksize=None, monitor=None, append=False, watermark='Timestamp'):
         """
         - Initialise the Performance Management Framework class
 
@@ -36,6 +42,18 @@ class Preprocessing:
         -> 1: First, remove columns where missing values make up 10% or more of the total data points
               Then, remove all remaining missing values from the columns where they are detected
         file_type: str, filetype of the raw dataset
+        save_type: str, filetype of the cleaned dataset ('xlsx', 'xls', 'csv', 'parquet', 'arrow' or 'feather', None: same as file_type)
+        categories: dic, Sequence of responses of the categorical columns, kept in the Parquet and Arrow files: {'col1': ['A', 'B', 'C']}
+        checkpoint: str, Folder where the output of each stage is saved, a rerun resumes from the first stage
+                    whose inputs or parameters have changed (None: no checkpoints)
+        multi_select: dic, Multi-select columns of the raw dataset and the prefix of their indicator columns: {'col1': 'Q5_'}
+        value_maps: dic, Columns of the raw dataset whose answer codes are replaced: {'col1': {1: 'A', 2: 'B'}}
+        chunksize: int, Number of rows processed at once in the streaming mode for large csv files, the cleaned
+                   dataset is written chunk by chunk (None: load the whole dataset)
+        monitor: RunMonitor, Run monitor measuring each stage, a summary is printed at the end (None: not measured)
+        append: True/False, Only process the submissions of the export that are not in the cleaned dataset yet and append
+                them to it (see processing_append), the first run processes the whole dataset
+        watermark: str, Column of the submission time (new name from cols_new) used to find the new submissions
         """
         self.name = name
         self.file_path = file_path
@@ -47,6 +65,19 @@ class Preprocessing:
         self.identifiers = identifiers
         self.cols_new = cols_new
         self.del_type = del_type
+        self.save_type = save_type if save_type is not None else file_type
+        self.categories = categories
+        self.checkpoint = checkpoint
+        self.multi_select = multi_select if multi_select is not None else {}
+        self.value_maps = value_maps if value_maps is not None else {}
+        self.chunksize = chunksize
+        self.monitor = monitor
+        self.append = append
+        self.watermark = watermark
+        self.append_state = None
+        self.append_keys = None # Sorted hashes of the identifiers of the rows processed so far (append mode)
+        self.append_latest = [] # Latest submission time of the rows processed by this run (append mode)
+        self.vocabularies = {}
         self.df = None
     
     def data_load(self):
@@ -116,7 +147,7 @@ class Preprocessing:
             print("")
             print(f'Number of columns: {len(df.columns)} | After removing the columns that contained missing values more than 10% of data points')
             print(f'Dropped columns = {cols_to_drop}')
-            df_cleaned = df_cleaned.dropna(subset=miss_col)
+            df_cleaned = df_cleaned.dropna(subset=[col for col in miss_col if col not in cols_to_drop])
         
         remaind_data_points = len(df_cleaned)
         print("")
@@ -127,24 +158,18 @@ class Preprocessing:
         return True
     
     def dataset_wrangling(self):
+        """
+        - To split the multi-select columns into indicator columns and replace the answer codes
+        """
         df = self.df
-        
-        df['5. What types of disabilities are you aware of?\n(select more than one if applicable)'] = (df['5. What types of disabilities are you aware of?\n(select more than one if applicable)'].fillna('').apply(lambda x: ','.join(sorted(set(i.strip() for i in x.split(',') if i.strip())))))
-        dummies2 = df['5. What types of disabilities are you aware of?\n(select more than one if applicable)'].str.get_dummies(sep=',')
-        dummies2.columns = [f"Q5_{col}" for col in dummies2.columns]
-        df = pd.concat([df, dummies2], axis=1)
-        
-        df['8. Check the box if you agree with the statements'] = (df['8. Check the box if you agree with the statements'].fillna('').apply(lambda x: ','.join(sorted(set(i.strip() for i in x.split(',') if i.strip())))))
-        dummies1 = df['8. Check the box if you agree with the statements'].str.get_dummies(sep=',')
-        dummies1.columns = [f"Q8_{col}" for col in dummies1.columns]
-        df = pd.concat([df, dummies1], axis=1)
-        
-        knowledge_map = {1: 'No knowledge', 2: 'Minimal knowledge', 3: 'Basic knowledge', 4: 'Adequate knowledge', 5: 'Excellent knowledge'}
-        df['7. How would you rate your level of knowledge about government policies or strategies such as the Persons with Disabilities Act?'] = \
-            df['7. How would you rate your level of knowledge about government policies or strategies such as the Persons with Disabilities Act?'].map(knowledge_map)
+        for col, prefix in self.multi_select.items():
+            df[col], dummies = multi_select_dummies(df[col], prefix, vocabulary=self.vocabularies.get(col))
+            df = pd.concat([df, dummies], axis=1)
+            if self.append == True:
+                self.vocabularies[col] = [name[len(prefix):] for name in dummies.columns] # Kept for the next appended exports
 
-        df['4. How would you rate your level of knowledge about disabilities?'] = \
-            df['4. How would you rate your level of knowledge about disabilities?'].map(knowledge_map)
+        for col, value_map in self.value_maps.items():
+            df[col] = df[col].map(value_map)
         self.df = df
         return True
     
@@ -154,7 +179,7 @@ class Preprocessing:
         """
         df = self.df
         file_path = self.file_path
-        file_type = self.file_type
+        file_type = self.save_type
         if file_type == 'xlsx' or file_type == 'xls':
             df.reset_index(drop=True, inplace = True)
             df.to_excel(f"{file_path}.{file_type}", index=False)
@@ -167,23 +192,14 @@ class Preprocessing:
             self.df = df
             print("The revised dataset has been saved")
             return True
-        else: 
-            print("Please use 'xlsx', 'xls' or 'csv' file")
-            return False
-        if file_type == 'xlsx':
-            df.reset_index(drop=True, inplace = True)
-            df.to_excel(f"{file_path}.{file_type}", index=False)
-            self.df = df
-            print("The revised dataset has been saved")
-            return True
-        elif file_type == 'csv':
+        elif file_type in columnar_types:
             df.reset_index(drop=True, inplace = True)
-            df.to_csv(f"{file_path}.{file_type}", index=False)
+            save_dataset(df, f"{file_path}.{file_type}", categories=self.categories)
             self.df = df
             print("The revised dataset has been saved")
             return True
         else: 
-            print("Please use 'xlsx' or 'csv' file")
+            print("Please use 'xlsx', 'xls', 'csv', 'parquet', 'arrow' or 'feather' file")
             return False
     
     def duplicates(self):
@@ -237,6 +253,379 @@ class Preprocessing:
         self.df = df
         return True
 
+    def stages(self):
+        """
+        - Stages of the data pre-processing with the parameters they depend on
+        """
+        raw_file = f"{self.file_path}.{self.file_type}"
+        raw_signature = None
+        if os.path.exists(raw_file):
+            raw_stat = os.stat(raw_file)
+            raw_signature = (raw_stat.st_size, raw_stat.st_mtime_ns)
+        return [('load', self.data_load, [raw_file, raw_signature]),
+                ('wrangling', self.dataset_wrangling, [self.multi_select, self.value_maps]),
+                ('rename', self.columns_redefine, [self.cols_new]),
+                ('duplicates', self.duplicates, [self.identifiers]),
+                ('dates', self.date_filter, [self.dates]),
+                ('columns', self.delete_columns, [self.list_del_cols]),
+                ('missing', self.missing_value_clean, [self.miss_col, self.del_type])]
+
+    def stage_skipped(self, stage):
+        """
+        - Whether a stage has nothing to do with these parameters (no pilot dates): it is not run and has no checkpoint
+        stage: str, Name of the stage
+        """
+        return stage == 'dates' and len(self.dates) == 0
+
+    def stage_keys(self, stages):
+        """
+        - Fingerprint of each stage: the fingerprint of the previous stage and the parameters of this stage
+        stages: list, Stages from stages()
+        """
+        keys = []
+        key = ''
+        for stage, function, params in stages:
+            key = hashlib.sha256(repr([key, stage, params]).encode('utf-8')).hexdigest()
+            keys.append(key)
+        return keys
+
+    def resume(self, stages, keys):
+        """
+        - To load the output of the last stage whose checkpoint is still valid
+        - Return the number of the first stage to run
+        stages: list, Stages from stages()
+        keys: list, Fingerprints from stage_keys()
+        """
+        manifest_path = os.path.join(self.checkpoint, 'checkpoints.json')
+        if not os.path.exists(manifest_path):
+            return 0
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        for number in reversed(range(len(stages))):
+            stage = stages[number][0]
+            if self.stage_skipped(stage):
+                continue # Its output is the checkpoint of the previous stage, its key is kept in the keys of the next stages
+            path = os.path.join(self.checkpoint, f'{number}_{stage}.pkl')
+            if manifest.get(stage) == keys[number] and os.path.exists(path):
+                self.df = pd.read_pickle(path)
+                print(f"Resumed from the checkpoint of the '{stage}' stage: {path}")
+                return number + 1
+        return 0
+
+    def save_checkpoint(self, number, stage, key):
+        """
+        - To save the output of a stage with its fingerprint
+        number: int, Number of the stage
+        stage: str, Name of the stage
+        key: str, Fingerprint of the stage
+        """
+        os.makedirs(self.checkpoint, exist_ok=True)
+        manifest_path = os.path.join(self.checkpoint, 'checkpoints.json')
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        self.df.to_pickle(os.path.join(self.checkpoint, f'{number}_{stage}.pkl'))
+        manifest[stage] = key
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        return True
+
+    def vocabulary_scan(self):
+        """
+        - To find all the answers of the multi-select columns before the dataset is processed in chunks
+          (every chunk then has the same indicator columns)
+        """
+        responses = {col: set() for col in self.multi_select}
+        if len(responses) != 0:
+            for chunk in pd.read_csv(f"{self.file_path}.csv", usecols=list(responses), dtype=str, chunksize=self.chunksize):
+                for col in responses:
+                    responses[col].update(chunk[col].dropna().unique())
+        self.vocabularies = {col: sorted(set(answer for response in responses[col] for answer in split_answers(response)))
+                             for col in responses}
+        return True
+
+    def stream_chunks(self):
+        """
+        - To read the csv dataset in chunks and process each chunk up to the missing value handling
+        - Duplicates are detected across the chunks with the hashed identifiers of the rows already kept
+        """
+        seen = np.array([], dtype=np.uint64)
+        repeated_keys = np.array([], dtype=np.uint64)
+        self.stream_rows = 0
+        self.stream_duplicates = 0
+        self.stream_repeated = 0
+        self.stream_keys = seen
+        reader = pd.read_csv(f"{self.file_path}.csv", dtype={col: str for col in self.multi_select}, chunksize=self.chunksize)
+        for number, chunk in enumerate(reader):
+            self.df = chunk
+            self.dataset_wrangling()
+            if number == 0:
+                self.columns_redefine()
+            else:
+                self.df.columns = self.cols_new
+            df = self.df
+            self.stream_rows += len(df)
+
+            keys = identifier_keys(df, self.identifiers)
+            position = np.searchsorted(seen, keys)
+            repeated = pd.Series(keys).duplicated().values
+            if len(seen) != 0:
+                repeated |= seen[np.minimum(position, len(seen) - 1)] == keys
+            new_keys = np.unique(keys[~repeated])
+            seen = np.insert(seen, np.searchsorted(seen, new_keys), new_keys)
+            new_repeated = np.setdiff1d(keys[repeated], repeated_keys)
+            repeated_keys = np.insert(repeated_keys, np.searchsorted(repeated_keys, new_repeated), new_repeated)
+            self.stream_duplicates += int(repeated.sum())
+            self.stream_repeated = len(repeated_keys)
+            self.stream_keys = seen
+            self.df = df[~repeated]
+
+            if len(self.dates) != 0:
+                self.date_filter()
+            yield self.df.drop(columns=self.list_del_cols)
+
+    def processing_stream(self):
+        """
+        - To conduct data pre-processing on a csv dataset in chunks, the memory use does not depend on the
+          number of rows (apart from 8 bytes per respondent for the duplicate detection)
+        - The stages are the same as processing(), and the cleaned chunks are appended to the cleaned csv file
+        - With del_type = 1, the missing values are counted in a first pass over the dataset
+        """
+        if self.file_type != 'csv' or self.save_type != 'csv':
+            print("The streaming mode (chunksize) only supports 'csv' files")
+            return False
+        miss_col = self.miss_col
+        self.vocabulary_scan()
+
+        cols_to_drop = []
+        if self.del_type == 1:
+            missing = pd.Series(0, index=miss_col)
+            points = 0
+            for chunk in self.stream_chunks():
+                missing += chunk[miss_col].isnull().sum()
+                points += len(chunk)
+            cols_to_drop = [col for col in miss_col if missing[col] > 0.1 * points]
+        subset = [col for col in miss_col if col not in cols_to_drop]
+
+        file_path = f'{self.file_path}_cleaned.csv'
+        missing = pd.Series(0, index=miss_col)
+        points = 0
+        remaind_data_points = 0
+        for number, chunk in enumerate(self.stream_chunks()):
+            missing += chunk[miss_col].isnull().sum()
+            points += len(chunk)
+            if self.append == True:
+                self.append_latest.append(latest_submission(chunk[self.watermark]))
+            chunk = chunk.drop(columns=cols_to_drop).dropna(subset=subset)
+            remaind_data_points += len(chunk)
+            chunk.to_csv(f'{file_path}.tmp', index=False, header=(number == 0), mode='w' if number == 0 else 'a')
+        os.replace(f'{file_path}.tmp', file_path)
+        self.df = None
+        self.append_keys = self.stream_keys
+
+        print(f'Initial data points: {self.stream_rows}')
+        print("")
+        print(f"Number of duplicate based on '{self.identifiers}': {self.stream_duplicates + self.stream_repeated}")
+        print(f"Number of data points: {self.stream_rows - self.stream_duplicates} | After removing duplicates")
+        print("")
+        for col in miss_col:
+            print(f'Column {col} has {missing[col]} missing values')
+        if self.del_type == 1:
+            print(f'Dropped columns = {cols_to_drop}')
+        print("")
+        print(f'Number of deleted missing values: {points - remaind_data_points}')
+        print("")
+        print(f'Final number of data points: {remaind_data_points}')
+        print(f"Cleaned dataframe has been saved: {file_path}")
+        return True
+
+    def append_paths(self):
+        """
+        - Directories of the cleaned dataset, of the state of the append mode (JSON) and of the index of the identifiers
+        """
+        cleaned = f'{self.file_path}_cleaned'
+        return f'{cleaned}.{self.save_type}', f'{cleaned}.append.json', f'{cleaned}.identifiers.npy'
+
+    def append_settings(self):
+        """
+        - Fingerprint of the settings the cleaned dataset depends on (the whole dataset is processed again when they change)
+        """
+        settings = [self.cols_new, self.identifiers, self.watermark, self.multi_select, self.value_maps, self.dates,
+                    self.list_del_cols, self.miss_col, self.del_type, self.save_type]
+        return hashlib.sha256(repr(settings).encode('utf-8')).hexdigest()
+
+    def load_append_state(self):
+        """
+        - To load the state of the append mode (None: no cleaned dataset yet or its settings have changed)
+        """
+        cleaned, state_path, keys_path = self.append_paths()
+        if not (os.path.exists(cleaned) and os.path.exists(state_path) and os.path.exists(keys_path)):
+            print("There is no cleaned dataset to append to yet: the whole dataset is processed")
+            return None
+        with open(state_path) as f:
+            state = json.load(f)
+        if state.get('settings') != self.append_settings():
+            print("The preprocessing settings have changed since the cleaned dataset was saved: the whole dataset is processed")
+            return None
+        self.append_keys = np.load(keys_path)
+        return state
+
+    def save_append_state(self, columns):
+        """
+        - To save the watermark (latest submission processed) and the index of the identifiers after a run
+        columns: list, Columns of the cleaned dataset
+        """
+        cleaned, state_path, keys_path = self.append_paths()
+        latest = [time for time in self.append_latest if time is not None]
+        if self.append_state is not None and self.append_state.get('watermark') is not None:
+            latest.append(pd.Timestamp(self.append_state['watermark']))
+        state = {'settings': self.append_settings(),
+                 'watermark': max(latest).isoformat() if len(latest) != 0 else None,
+                 'columns': list(columns),
+                 'dropped_columns': [col for col in self.miss_col if col not in columns],
+                 'vocabularies': self.vocabularies,
+                 'identifiers': len(self.append_keys)}
+        with open(f'{keys_path}.tmp', 'wb') as f:
+            np.save(f, self.append_keys)
+        os.replace(f'{keys_path}.tmp', keys_path)
+        with open(f'{state_path}.tmp', 'w') as f:
+            json.dump(state, f, indent=1)
+        os.replace(f'{state_path}.tmp', state_path)
+        self.append_state = state
+        print(f"Watermark of the append mode: {state['watermark']} | {state['identifiers']} identifiers in the index: {keys_path}")
+        return True
+
+    def append_load(self):
+        """
+        - To load the export and keep the rows submitted at or after the watermark (the rows at the watermark
+          itself are checked against the index of the identifiers by append_duplicates)
+        """
+        if self.watermark not in self.cols_new:
+            print(f"The watermark column '{self.watermark}' is not in cols_new")
+            return False
+        if self.file_type == 'csv': # Same answers as the stream mode, even when a multi-select column only has numbers
+            self.df = pd.read_csv(f"{self.file_path}.csv", dtype={col: str for col in self.multi_select})
+        elif self.data_load() == False:
+            return False
+        df = self.df
+        initial_data_points = len(df)
+        watermark = self.append_state['watermark']
+        if watermark is not None:
+            times = pd.to_datetime(df[df.columns[self.cols_new.index(self.watermark)]], errors='coerce')
+            df = df[times.isna() | (times >= pd.Timestamp(watermark))]
+        print(f"Data points in the export: {initial_data_points} | New submissions since {watermark}: {len(df)}")
+
+        for col, vocabulary in self.append_state['vocabularies'].items():
+            answers = set(answer for response in df[col].dropna().unique() for answer in split_answers(response))
+            new_answers = sorted(answers - set(vocabulary))
+            if len(new_answers) != 0:
+                print(f"New answers of '{col}' have no column in the cleaned dataset: {new_answers}")
+                print("Please add their columns to cols_new and process the whole dataset (append = False)")
+                return False
+        self.vocabularies = self.append_state['vocabularies']
+        self.df = df
+        return True
+
+    def append_duplicates(self):
+        """
+        - To remove the new rows that repeat each other or a row already processed (persisted index of the
+          hashed identifiers)
+        """
+        df = self.df
+        seen = self.append_keys
+        keys = identifier_keys(df, self.identifiers)
+        repeated = pd.Series(keys).duplicated().values
+        if len(seen) != 0:
+            repeated |= seen[np.minimum(np.searchsorted(seen, keys), len(seen) - 1)] == keys
+        new_keys = np.unique(keys[~repeated])
+        self.append_keys = np.insert(seen, np.searchsorted(seen, new_keys), new_keys)
+        self.append_latest.append(latest_submission(df[self.watermark]))
+        self.df = df[~repeated]
+        print("")
+        print(f"Number of duplicate based on '{self.identifiers}': {int(repeated.sum())} | In the new rows or already processed")
+        print(f"Number of data points: {len(self.df)} | After removing duplicates")
+        return True
+
+    def append_missing(self):
+        """
+        - To remove the missing values of the new rows, with the columns dropped from the cleaned dataset
+          (del_type = 1) kept as they were when the whole dataset was processed
+        """
+        df = self.df
+        dropped = self.append_state['dropped_columns']
+        initial_data_points = len(df)
+        print("")
+        for col in self.miss_col:
+            print(f'Column {col} has {df[col].isnull().sum()} missing values')
+        df = df.drop(columns=dropped).dropna(subset=[col for col in self.miss_col if col not in dropped])
+        print("")
+        print(f'Number of deleted missing values: {initial_data_points - len(df)}')
+        self.df = df
+        return True
+
+    def append_data(self):
+        """
+        - To append the new rows to the cleaned dataset (csv files are appended in place, the other formats are
+          read and saved again)
+        """
+        cleaned = self.append_paths()[0]
+        df = self.df.reset_index(drop=True)
+        if list(df.columns) != self.append_state['columns']:
+            print(f"The new rows do not have the columns of the cleaned dataset: {cleaned}")
+            return False
+        if self.save_type == 'csv':
+            df.to_csv(cleaned, index=False, header=False, mode='a')
+        else:
+            original = self.file_path
+            self.df = pd.concat([load_dataset(cleaned), df], ignore_index=True)
+            self.file_path = f'{original}_cleaned'
+            done = self.save_data()
+            self.file_path = original
+            self.df = df
+            if done == False:
+                return False
+        print(f"Number of data points appended: {len(df)} | Cleaned dataframe: {cleaned}")
+        return True
+
+    def processing_append(self):
+        """
+        - To conduct data pre-processing on the new submissions of an export only (e.g. the daily export of the fieldwork)
+        1. Keep the rows submitted at or after the watermark (latest submission already processed)
+        2. Wrangling and renaming as processing()
+        3. Remove the duplicates, also against the index of the hashed identifiers of all the rows processed so far
+        4. Pilot dates, columns and missing values as processing()
+        5. Append the rows to the cleaned dataset, then save the new watermark and index
+        - Without a cleaned dataset, or after the settings have changed, the whole dataset is processed and the
+          state of the append mode is saved next to the cleaned dataset
+        """
+        self.append_state = self.load_append_state()
+        if self.append_state is None:
+            if self.chunksize is not None:
+                if self.processing_stream() == False:
+                    return False
+                columns = pd.read_csv(self.append_paths()[0], nrows=0).columns
+            else:
+                if self.processing_stages(resume=False) == False:
+                    return False
+                columns = self.df.columns
+            return self.save_append_state(columns)
+
+        stages = [('load', self.append_load), ('wrangling', self.dataset_wrangling), ('rename', self.columns_redefine),
+                  ('duplicates', self.append_duplicates), ('dates', self.date_filter), ('columns', self.delete_columns),
+                  ('missing', self.append_missing), ('save', self.append_data)]
+        for stage, function in stages:
+            if not self.stage_skipped(stage):
+                with monitor_stage(self.monitor, 'preprocessing', stage, rows_in=None if self.df is None else len(self.df)) as event:
+                    done = function()
+                    event['rows'] = None if self.df is None else len(self.df)
+                if done == False:
+                    return False
+            if stage == 'load' and len(self.df) == 0:
+                print("There are no new submissions to append")
+                return True
+        return self.save_append_state(self.append_state['columns'])
+
     def processing(self):
         """
         - To conduct data pre-processing
@@ -248,22 +637,113 @@ class Preprocessing:
         6. Handle missing values
         7. Extract answers from open-ended questions
         8. Save the cleaned dataset
+        - With checkpoints, the stages before the first changed stage are loaded from the checkpoint folder
+        - With chunksize, the csv dataset is processed in chunks (processing_stream)
+        - With append, only the new submissions are processed and appended to the cleaned dataset (processing_append)
+        """
+        with monitor_stage(self.monitor, 'run', 'processing', chunksize=self.chunksize, append=self.append) as event:
+            if self.append == True:
+                result = self.processing_append()
+                event['rows'] = None if self.df is None else len(self.df)
+            elif self.chunksize is not None:
+                result = self.processing_stream()
+                event['rows'] = getattr(self, 'stream_rows', None)
+            else:
+                result = self.processing_stages()
+                event['rows'] = None if self.df is None else len(self.df)
+        if self.monitor is not None:
+            self.monitor.print_summary()
+        return result
+
+    def processing_stages(self, resume=True):
+        """
+        - To run the stages of processing() on the whole dataset
+        resume: True/False, Resume from the checkpoints (False: run all the stages, their checkpoints are still saved)
         """
-        self.data_load()
-        self.dataset_wrangling()
-        self.columns_redefine()
-        print(f'Initial data points: {len(self.df)}')
-        self.duplicates()
-        if len(self.dates) != 0:
-            self.date_filter()
-        print(f'Initial number of columns: {len(self.df.columns)}')
-        self.delete_columns()
-        self.missing_value_clean()
+        stages = self.stages()
+        keys = self.stage_keys(stages)
+        start = 0
+        if self.checkpoint is not None and resume == True:
+            start = self.resume(stages, keys)
+
+        for number, (stage, function, params) in enumerate(stages):
+            if number < start:
+                continue
+            if stage == 'duplicates':
+                print(f'Initial data points: {len(self.df)}')
+            if stage == 'columns':
+                print(f'Initial number of columns: {len(self.df.columns)}')
+            if not self.stage_skipped(stage):
+                with monitor_stage(self.monitor, 'preprocessing', stage, rows_in=None if self.df is None else len(self.df)) as event:
+                    done = function()
+                    event['rows'] = None if self.df is None else len(self.df)
+                if done == False:
+                    return False
+            if stage == 'duplicates' and self.append == True:
+                self.append_keys = np.sort(identifier_keys(self.df, self.identifiers))
+                self.append_latest.append(latest_submission(self.df[self.watermark]))
+            if self.checkpoint is not None and not self.stage_skipped(stage):
+                self.save_checkpoint(number, stage, keys[number])
+
         original = self.file_path
         self.file_path = f'{self.file_path}_cleaned'
-        self.save_data()
+        with monitor_stage(self.monitor, 'preprocessing', 'save', len(self.df), save_type=self.save_type):
+            self.save_data()
         self.file_path = original
         print("")
         print(f'Final number of data points: {len(self.df)}')
-        print(f"Cleaned dataframe has been saved: {self.file_path}_cleaned.{self.file_type}")
-        return True
\ No newline at end of file
+        print(f"Cleaned dataframe has been saved: {self.file_path}_cleaned.{self.save_type}")
+        return True
+
+
+def identifier_keys(df, identifiers):
+    """
+    - Hash (uint64) of the identifiers of each row, to detect duplicates across chunks and appended exports
+    df: Dataframe, Rows with the identifiers
+    identifiers: list, Columns for checking duplicates
+    """
+    return pd.util.hash_pandas_object(df[identifiers], index=False).values
+
+
+def latest_submission(series):
+    """
+    - Latest submission time of a column (None if none of its values is a date)
+    series: series, Submission times (e.g., Timestamp)
+    """
+    latest = pd.to_datetime(series, errors='coerce').max()
+    return None if pd.isna(latest) else latest
+
+
+def split_answers(response, sep=','):
+    """
+    - To split a multi-select response into its answers (sorted, duplicates removed)
+    response: str, Response to a multi-select question (e.g., '3, 1,2')
+    sep: str, Separator of the answers
+    """
+    return sorted(set(answer.strip() for answer in str(response).split(sep) if answer.strip()))
+
+
+def multi_select_dummies(series, prefix, sep=',', vocabulary=None):
+    """
+    - To split a multi-select column into one indicator column (0/1) per answer
+    - Each distinct response is split once and mapped back to the rows with its code
+    - Return the normalised column (answers sorted, duplicates removed) and the indicator columns
+    series: series, Multi-select column (e.g., '3, 1,2')
+    prefix: str, Prefix of the indicator columns (e.g., 'Q5_' -> 'Q5_1', 'Q5_2')
+    sep: str, Separator of the answers
+    vocabulary: list, All the answers of the column, e.g. when the column is processed in chunks (None: answers in the series)
+    """
+    codes, responses = pd.factorize(series.fillna(''))
+    answers = [split_answers(response, sep) for response in responses]
+    normalised = np.array([sep.join(answer) for answer in answers] + [''], dtype=object)
+
+    if vocabulary is None:
+        vocabulary = sorted(set(answer for answer_list in answers for answer in answer_list))
+    position = {answer: number for number, answer in enumerate(vocabulary)}
+    matrix = np.zeros((len(responses) + 1, len(vocabulary)), dtype=np.uint8)
+    for number, answer_list in enumerate(answers):
+        matrix[number, [position[answer] for answer in answer_list]] = 1
+
+    # factorize() gives -1 to missing values, which picks the last (empty) row
+    dummies = pd.DataFrame(matrix[codes], index=series.index, columns=[f"{prefix}{answer}" for answer in vocabulary])
+    return pd.Series(normalised[codes], index=series.index, name=series.name), dummies
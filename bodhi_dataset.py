@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+
+Please download following Python Library for the Parquet and Arrow (IPC) formats:
+1. pyarrow
+"""
+
+import pandas as pd
+import os
+
+columnar_types = ['parquet', 'arrow', 'feather']
+
+
+def file_type_of(file_path):
+    """
+    - File type from the extension of the file ('xlsx', 'xls', 'csv', 'parquet', 'arrow' or 'feather')
+    file_path: str, Directory of the dataset
+    """
+    return os.path.splitext(file_path)[1].lstrip('.').lower()
+
+
+def ordered_category(series, order):
+    """
+    - To convert a column into an ordered categorical column following the given order
+    - Values missing from the order are kept (added after the declared categories) and returned
+    series: series, Column of the dataset
+    order: list, Sequence of responses from the variable
+    """
+    declared = set(order)
+    outside = [value for value in series.dropna().unique() if value not in declared]
+    categories = list(order) + outside
+    return series.astype(pd.CategoricalDtype(categories=categories, ordered=True)), outside
+
+
+def encode_categories(df, categories):
+    """
+    - To convert the columns into ordered categorical columns (the dataframe is changed and returned)
+    - Values that are not in the order of their column are reported (and kept after the declared categories)
+    df: Dataframe, Dataset
+    categories: dic, Sequence of responses of the categorical columns: {'col1': ['A', 'B', 'C']}
+    """
+    for col, order in categories.items():
+        if col not in df.columns:
+            continue
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and df[col].cat.ordered and list(df[col].cat.categories[:len(order)]) == list(order):
+            continue # Already encoded (e.g., Parquet and Arrow files)
+        df[col], outside = ordered_category(df[col], order)
+        if len(outside) > 0:
+            print(f"Column {col} has values that are not in its order: {outside}")
+    return df
+
+
+def save_dataset(df, file_path, categories=None):
+    """
+    - To save a dataset (xlsx, xls, csv, parquet or arrow/feather)
+    - The Parquet and Arrow (IPC) files keep the data types, including the ordered categories
+    df: Dataframe, Dataset
+    file_path: str, Directory of the dataset (with the file extension)
+    categories: dic, Sequence of responses of the categorical columns: {'col1': ['A', 'B', 'C']}
+    """
+    file_type = file_type_of(file_path)
+    if categories is not None and file_type in columnar_types:
+        df = encode_categories(df.copy(deep=False), categories)
+
+    if file_type == 'xlsx' or file_type == 'xls':
+        df.to_excel(file_path, index=False)
+    elif file_type == 'csv':
+        df.to_csv(file_path, index=False)
+    elif file_type == 'parquet':
+        df.to_parquet(file_path, index=False)
+    elif file_type == 'arrow' or file_type == 'feather':
+        df.to_feather(file_path, compression='uncompressed') # Uncompressed files can be memory-mapped
+    else:
+        print("Please use 'xlsx', 'xls', 'csv', 'parquet', 'arrow' or 'feather' file")
+        return False
+    return True
+
+
+def load_dataset(file_path, columns=None, categories=None):
+    """
+    - To load a dataset, only reading the given columns
+    - Parquet and Arrow (IPC) files are memory-mapped instead of being read into memory first
+    - The categorical columns are encoded once here, so the counts of the indicators work on integer codes
+    file_path: str, Directory of the dataset (with the file extension)
+    columns: list, Columns to load (None: all the columns)
+    categories: dic, Sequence of responses of the categorical columns: {'col1': ['A', 'B', 'C']} (see indicator_categories())
+    """
+    file_type = file_type_of(file_path)
+    if file_type == 'xlsx' or file_type == 'xls':
+        df = pd.read_excel(file_path, usecols=columns)
+    elif file_type == 'csv':
+        df = pd.read_csv(file_path, usecols=columns)
+    elif file_type == 'parquet':
+        import pyarrow.parquet as pq
+        df = pq.read_table(file_path, columns=columns, memory_map=True).to_pandas()
+    elif file_type == 'arrow' or file_type == 'feather':
+        import pyarrow as pa
+        with pa.memory_map(file_path) as source:
+            table = pa.ipc.open_file(source).read_all()
+            if columns is not None:
+                table = table.select(columns)
+            df = table.to_pandas()
+    else:
+        raise ValueError("Please use 'xlsx', 'xls', 'csv', 'parquet', 'arrow' or 'feather' file")
+    if categories is not None:
+        df = encode_categories(df, categories)
+    return df
+
+
+def dataset_schema(file_path):
+    """
+    - To load the columns (and data types) of a dataset without its rows
+    file_path: str, Directory of the dataset (with the file extension)
+    """
+    file_type = file_type_of(file_path)
+    if file_type == 'xlsx' or file_type == 'xls':
+        return pd.read_excel(file_path, nrows=0)
+    elif file_type == 'csv':
+        return pd.read_csv(file_path, nrows=0)
+    elif file_type == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_schema(file_path).empty_table().to_pandas()
+    elif file_type == 'arrow' or file_type == 'feather':
+        import pyarrow as pa
+        with pa.memory_map(file_path) as source:
+            return pa.ipc.open_file(source).schema.empty_table().to_pandas()
+    raise ValueError("Please use 'xlsx', 'xls', 'csv', 'parquet', 'arrow' or 'feather' file")
+
+
+def required_columns(indicators):
+    """
+    - Columns of the dataset used by the indicators
+    indicators: list, List of the project indicators
+    """
+    columns = []
+    for indicator in indicators:
+        columns += [col for col in indicator.columns() if col not in columns]
+    return columns
+
+
+def indicator_categories(indicators):
+    """
+    - Sequence of responses of the dataset columns from the var_order of the indicators: {'col1': ['A', 'B', 'C']}
+    - Indicators with a calculation (their order is the one of the calculated column) or a statistical test are left out,
+      the first order given to a column is used
+    - Only the variables of the indicators are encoded: a column also used in another way by an indicator (breakdown,
+      intersection, statistical test group, condition, calculated or tested variable) keeps its type, so the order of
+      its categories in the tables does not depend on the var_order of another indicator (nor on the selected indicators)
+    indicators: list, List of the project indicators
+    """
+    others = set()
+    for indicator in indicators:
+        owner = indicator.var_order is not None and indicator.i_cal is None and indicator.s_test is None
+        variables = [indicator.var] if isinstance(indicator.var, str) else list(indicator.var)
+        others.update(col for col in indicator.columns() if not (owner and col in variables))
+        if isinstance(indicator.condition, tuple):
+            others.update(clause[0] for clause in indicator.condition)
+
+    categories = {}
+    for indicator in indicators:
+        order = indicator.var_order
+        if order is None or indicator.i_cal is not None or indicator.s_test is not None:
+            continue
+        if len(set(order)) != len(order):
+            print(f"{indicator.indicator_name} has repeated responses in its sequence of responses, which is not encoded")
+            continue
+        variables = [indicator.var] if isinstance(indicator.var, str) else list(indicator.var)
+        for col in variables:
+            if col in others:
+                continue
+            if col not in categories:
+                categories[col] = list(order)
+            elif categories[col] != list(order):
+                print(f"{indicator.indicator_name} has another sequence of responses for {col}, the first one is used: {categories[col]}")
+    return categories
+
+
+def attach_dataset(indicators, df):
+    """
+    - To give the (loaded) dataset to the indicators defined with dataset_schema()
+    - Conditions given as boolean series should be added after this step as they depend on the rows of the dataset
+      (declarative conditions, e.g. ('Q2_sex', '==', 'Female'), can be added before)
+    indicators: list, List of the project indicators
+    df: Dataframe, Dataset
+    """
+    for indicator in indicators:
+        indicator.df = df
+    return indicators
@@ -8,6 +8,45 @@ Created on Tue Sep 17 15:03:27 2024
 
 import pandas as pd
 import numpy as np
+import operator
+
+condition_ops = {'==': operator.eq, '!=': operator.ne, '>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le,
+                 'in': lambda values, options: values.isin(options), 'not in': lambda values, options: ~values.isin(options)}
+
+
+def condition_spec(conditions):
+    """
+    - To turn a declarative condition into its canonical form: a sorted tuple of (column, operator, value) clauses
+    - Conditions written differently but meaning the same (order of the clauses, of the 'in' values) get the same form,
+      so their rows are only selected once per run
+    conditions: tuple, list or dic, One clause ('Q2_sex', '==', 'Female'), several clauses (all of them are met)
+                [('Q2_sex', '==', 'Female'), ('Q1_age', 'in', ['15 - 19 years old'])] or {'Q2_sex': 'Female'} (equal to)
+    """
+    if isinstance(conditions, dict):
+        clauses = [(col, '==', value) for col, value in conditions.items()]
+    elif isinstance(conditions, tuple) and len(conditions) == 3 and isinstance(conditions[1], str):
+        clauses = [conditions]
+    else: clauses = list(conditions)
+
+    canonical = set()
+    for col, op, value in clauses:
+        op = op.strip().lower()
+        if op not in condition_ops:
+            raise ValueError(f"Unknown operator '{op}' in the condition on {col} (use {', '.join(condition_ops)})")
+        if op == 'in' or op == 'not in':
+            value = tuple(sorted(set(value), key=repr))
+        canonical.add((col, op, value))
+    return tuple(sorted(canonical, key=repr))
+
+
+def condition_mask(df, clause):
+    """
+    - To evaluate one clause of a declarative condition on the dataset (missing values do not meet it)
+    df: Dataframe, Dataset
+    clause: tuple, Clause of the condition: (column, operator, value)
+    """
+    col, op, value = clause
+    return np.asarray(condition_ops[op](df[col], value).fillna(False), dtype=bool)
 
 
 class Indicator:
@@ -26,7 +65,10 @@ class Indicator:
         score_map: dic, Way to calculate the score for this indicator
         valid_point: float, Valid points for indicator calculation
         breakdown: dic, Variables for data disaggregation {"col1":"name1"}
-        condition: condition, Conditions for indicator calculation
+        intersections: list, Combinations of variables for intersectional disaggregation [{"col1":"name1", "col2":"name2"}]
+        condition: series or tuple, Conditions for indicator calculation (boolean series or canonical condition spec)
+        rows: array, Positions of the rows of the dataset meeting the condition (set by the data analysis)
+        derived: Dataframe, Columns calculated for the indicator on its rows (set by the data analysis)
         kap_label: list, Labels for multi-table
         s_test: str, Type of statistical tests ('ols', 'anova', 't-test','chi')
         s_group: dic, independent variables for statistical tests {"col":"name"}
@@ -54,7 +96,10 @@ class Indicator:
         self.score_map = None
         self.valid_point = None
         self.breakdown = None
+        self.intersections = None
         self.condition = None
+        self.rows = None # Positions of the rows of df used by the indicator (None: all the rows)
+        self.derived = None # Columns calculated for the indicator, on its rows (Dataframe)
         self.kap_label = None
         self.s_test = s_test
         self.s_group = s_group
@@ -128,12 +173,27 @@ class Indicator:
         self.breakdown = breakdown
         print(f"{self.indicator_name} will be broken down by {', '.join(self.breakdown.values())}")
 
+    def add_intersection(self, intersection):
+        """
+        - Add a combination of breakdown columns for intersectional disaggregation (e.g., gender x region)
+        - Each call adds one table with a row for each combination of the categories
+        intersection: dic, Breakdown columns and their names: {'col1':'gender', 'col2':'region'}
+        """
+        if self.intersections is None:
+            self.intersections = []
+        self.intersections.append(intersection)
+        print(f"{self.indicator_name} will be broken down by {' x '.join(intersection.values())}")
+
     def add_condition(self, conditions):
         """
         - Add the condition for the indicator
+        - A declarative condition is evaluated once per run and its rows are shared by all the indicators using it
         conditions: series, Filtering criteria for the indicator: (df['2'] > 25) & (df['4'] == 'Male')
+                    or declarative condition (see condition_spec()): [('2', '>', 25), ('4', '==', 'Male')]
         """
-        self.condition = conditions
+        if isinstance(conditions, (pd.Series, np.ndarray)):
+            self.condition = conditions
+        else: self.condition = condition_spec(conditions)
         
     def add_var_change(self, new_var):
         """
@@ -148,4 +208,45 @@ class Indicator:
         - Add the condition for column label change (for KAP)
         labels: list, New column labels for the multiple response questions in the KAP survey
         """
-        self.kap_label = labels
\ No newline at end of file
+        self.kap_label = labels
+        
+    def columns(self):
+        """
+        - Columns of the dataset used by the indicator (variables, breakdown, intersections and statistical test groups)
+        """
+        columns = [self.var] if isinstance(self.var, str) else list(self.var)
+        for group in [self.breakdown, self.s_group] + (self.intersections or []):
+            if group is not None:
+                columns += [col for col in group.keys() if col not in columns]
+        return columns
+
+    def column(self, col):
+        """
+        - Values of a column on the rows of the indicator (calculated columns included)
+        - The dataset shared by the indicators is not copied or changed
+        col: str, Column of the dataset or calculated column
+        """
+        if self.derived is not None and col in self.derived.columns:
+            return self.derived[col]
+        values = self.df[col]
+        if self.rows is not None:
+            values = values.iloc[self.rows]
+        return values
+
+    def data(self, columns=None):
+        """
+        - Dataframe of the rows of the indicator with only the given columns (calculated columns included)
+        columns: list, Columns of the dataframe (None: columns())
+        """
+        if columns is None:
+            columns = self.columns()
+        elif isinstance(columns, str):
+            columns = [columns]
+        columns = list(dict.fromkeys(columns))
+        derived = [] if self.derived is None else [col for col in columns if col in self.derived.columns]
+        data = self.df[[col for col in columns if col not in derived]]
+        if self.rows is not None:
+            data = data.iloc[self.rows]
+        if len(derived) != 0:
+            data = data.assign(**{col: self.derived[col].values for col in derived})
+        return data[columns]
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import contextlib
+import cProfile
+import datetime
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource # Peak memory of the process (not available on Windows)
+except ImportError:
+    resource = None
+
+
+def peak_rss():
+    """
+    - Peak resident memory (MB) of the process so far (None if it is not available)
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1) # Bytes on macOS, KB on Linux
+
+
+def current_rss():
+    """
+    - Current resident memory (MB) of the process (None if it is not available)
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class RunMonitor:
+
+    def __init__(self, log_path=None, profile=None, profile_modes=('cpu', 'memory'), profile_top=25):
+        """
+        - Initialise the run monitor class
+        - Each stage (preprocessing stage, indicator calculation, table, test or plot) is recorded as an event with its
+          wall time, CPU time, memory and number of rows, appended to a JSON-lines log and summarised at the end of the run
+        - With a profile folder, each stage is also profiled (slower run):
+          'cpu': cProfile statistics of the stage ({kind}_{name}.prof, e.g. read with pstats or snakeviz), the time of
+                 the stages run inside another stage (e.g. the indicators of a run) is only in their own file
+          'memory': tracemalloc top allocation sites of the stage ({kind}_{name}.allocations.txt, memory still allocated
+                    at the end of the stage by line of code and peak of the traced memory), for the stages that do
+                    not run other stages (e.g. each indicator, not the whole run)
+
+        log_path: str, Directory of the JSON-lines event log (None: events are only kept in memory)
+        profile: str, Folder of the profiles of the stages (None: no profiling)
+        profile_modes: list, Profilers run on each stage ('cpu', 'memory')
+        profile_top: int, Number of allocation sites kept for each stage
+        """
+        self.log_path = log_path
+        self.events = []
+        if log_path is not None and os.path.dirname(log_path) != '':
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        self.profile = profile
+        self.profile_modes = list(profile_modes)
+        self.profile_top = profile_top
+        self.profilers = [] # cProfile profilers of the stages being run (innermost last)
+        self.profile_names = {} # Number of stages profiled by file name (repeated names are numbered)
+        self.tracing = 0 # Number of stages being traced by tracemalloc
+        self.traced_stages = 0 # Number of stages traced since the start of the run
+        if profile is not None:
+            unknown = [mode for mode in self.profile_modes if mode not in ['cpu', 'memory']]
+            if len(unknown) > 0:
+                raise ValueError(f"Unknown profile modes: {unknown} ('cpu', 'memory')")
+            os.makedirs(profile, exist_ok=True)
+
+    def settings(self):
+        """
+        - Profile settings of the run, to create the monitors of the worker processes: RunMonitor(**monitor.settings())
+        """
+        return {'profile': self.profile, 'profile_modes': self.profile_modes, 'profile_top': self.profile_top}
+
+    @contextlib.contextmanager
+    def stage(self, kind, name, rows=None, **fields):
+        """
+        - Measure a stage: with monitor.stage('tables', '1.Sex') as event: ...
+        - The rows can be set inside the block (event['rows'] = len(df))
+        kind: str, Kind of stage ('preprocessing', 'load', 'calculation', 'tables', 'tests', 'plot', 'writer', 'run')
+        name: str, Name of the stage (e.g., stage of the preprocessing, indicator or chart)
+        rows: int, Number of rows processed
+        fields: Other details of the event (e.g., indicator='1.Sex')
+        """
+        event = {'kind': kind, 'name': name, 'rows': rows, **fields}
+        peak_before = peak_rss()
+        profile = self.start_profile() if self.profile is not None else None
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield event
+        except Exception as e:
+            event['error'] = str(e)
+            raise
+        finally:
+            event['wall'] = round(time.perf_counter() - wall, 4)
+            event['cpu'] = round(time.process_time() - cpu, 4)
+            if profile is not None:
+                self.stop_profile(profile, event)
+            event['rss_mb'] = current_rss()
+            event['peak_rss_mb'] = peak_rss()
+            # Growth of the peak memory of the process during the stage (the stage set a new peak)
+            event['peak_growth_mb'] = None if peak_before is None else round(event['peak_rss_mb'] - peak_before, 1)
+            self.record(event)
+
+    def start_profile(self):
+        """
+        - Start the profilers of a stage (the cProfile profiler of the enclosing stage is paused)
+        - The traces of tracemalloc are cleared at the start of each stage, so a snapshot at the end only holds the
+          memory allocated by the stage (taking snapshots of all the traces gets slow once scipy or statsmodels is loaded)
+        """
+        profile = {}
+        if 'memory' in self.profile_modes:
+            if self.tracing == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                profile['started'] = True
+            self.tracing += 1
+            self.traced_stages += 1
+            profile['traced'] = self.traced_stages
+            tracemalloc.clear_traces()
+        if 'cpu' in self.profile_modes:
+            if len(self.profilers) > 0:
+                self.profilers[-1].disable()
+            profiler = cProfile.Profile()
+            self.profilers.append(profiler)
+            profiler.enable()
+            profile['cpu'] = profiler
+        return profile
+
+    def stop_profile(self, profile, event):
+        """
+        - Stop the profilers of a stage and save its profiles (their files are added to the event)
+        profile: dic, Profilers from start_profile()
+        event: dic, Event of the stage
+        """
+        name = re.sub(r'[^\w.-]+', '_', f"{event['kind']}_{event['name']}").strip('_')
+        self.profile_names[name] = self.profile_names.get(name, 0) + 1
+        if self.profile_names[name] > 1:
+            name = f"{name}_{self.profile_names[name]}"
+        path = os.path.join(self.profile, name)
+
+        if 'cpu' in profile:
+            profiler = self.profilers.pop()
+            profiler.disable()
+        if 'traced' in profile:
+            # The stages run inside this stage cleared its traces: only their own allocation sites are saved
+            if profile['traced'] == self.traced_stages:
+                event['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+                ignored = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, cProfile.__file__))
+                stats = tracemalloc.take_snapshot().filter_traces(ignored).statistics('lineno')
+                with open(f'{path}.allocations.txt', 'w', encoding='utf-8') as f:
+                    f.write(f"Top allocation sites of {event['kind']} '{event['name']}' (memory allocated during the stage and not released, "
+                            f"peak of the traced memory: {event['traced_peak_mb']} MB)\n")
+                    for stat in stats[:self.profile_top]:
+                        f.write(f"{stat}\n")
+                event['allocations'] = f'{path}.allocations.txt'
+                event['allocated_mb'] = round(sum(stat.size for stat in stats) / 1024 / 1024, 1)
+            self.tracing -= 1
+            if profile.get('started') == True:
+                tracemalloc.stop()
+        if 'cpu' in profile:
+            profiler.dump_stats(f'{path}.prof')
+            event['profile'] = f'{path}.prof'
+        if len(self.profilers) > 0:
+            self.profilers[-1].enable()
+
+    def record(self, event):
+        """
+        - Add an event (e.g., measured in a worker process) to the run and to the log
+        event: dic, Event from stage()
+        """
+        event = {'time': datetime.datetime.now().isoformat(timespec='milliseconds'), **event}
+        self.events.append(event)
+        if self.log_path is not None:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(event, default=str) + '\n')
+        return event
+
+    def extend(self, events):
+        """
+        - Add the events of another monitor (e.g., of a worker process)
+        events: list, Events from RunMonitor.events
+        """
+        for event in events:
+            event = {name: value for name, value in event.items() if name != 'time'}
+            self.record(event)
+
+    def summary(self, top=None):
+        """
+        - Summary table of the run: total wall and CPU time, highest memory and rows by kind and name of stage
+          (slowest stages first)
+        top: int, Number of stages shown (None: all)
+        """
+        import pandas as pd
+        columns = ['kind', 'name', 'count', 'wall', 'cpu', 'peak_rss_mb', 'peak_growth_mb', 'rows']
+        if len(self.events) == 0:
+            return pd.DataFrame(columns=columns)
+        events = pd.DataFrame(self.events)
+        for col in columns:
+            if col not in events.columns:
+                events[col] = None
+        events['count'] = 1
+        summary = events.groupby(['kind', 'name'], sort=False).agg(
+            {'count': 'sum', 'wall': 'sum', 'cpu': 'sum', 'peak_rss_mb': 'max', 'peak_growth_mb': 'sum', 'rows': 'max'}).reset_index()
+        summary = summary.sort_values('wall', ascending=False, kind='stable').reset_index(drop=True)
+        if top is not None:
+            summary = summary.head(top)
+        return summary[columns]
+
+    def print_summary(self, top=20):
+        """
+        - Print the summary table at the end of the run
+        top: int, Number of stages shown
+        """
+        summary = self.summary(top)
+        if len(summary) == 0:
+            return False
+        print(f"\nSlowest stages of the run (wall and CPU time in seconds, memory in MB){'' if self.log_path is None else f' | Event log: {self.log_path}'}")
+        print(summary.to_string(index=False))
+        return True
+
+
+def monitor_stage(monitor, kind, name, rows=None, **fields):
+    """
+    - Measure a stage with a run monitor, or run it without measuring it (monitor = None)
+    monitor: RunMonitor, Run monitor (None: no instrumentation)
+    kind: str, Kind of stage (see RunMonitor.stage())
+    name: str, Name of the stage
+    rows: int, Number of rows processed
+    """
+    if monitor is None:
+        return contextlib.nullcontext({})
+    return monitor.stage(kind, name, rows, **fields)
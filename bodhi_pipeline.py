@@ -5,15 +5,27 @@
 """
 
 import bodhi_indicator as bd
-import bodhi_PMF as pmf
-import pandas as pd
 
 """
-Evaluation
+Settings of the run (the options of bodhi_cli.py replace them, e.g. --jobs 4)
 """
-# Specify the file path for the clean dataset
-df = pd.read_excel('data/24-UNICEF-GM-1 - Clean_Dataset.xlsx')
+project_name = 'Calabash' # Name of the project
+project_type = 'Evaluation' # Type of the project
+data_path = 'data/24-UNICEF-GM-1 - Clean_Dataset.xlsx' # File path for the clean dataset (xlsx, csv, parquet or arrow)
+file_path1 = 'data/Calabash Statistics.xlsx' # File path to save the statistics (including breakdown data)
+file_path2 = 'data/Calabash Test Results.xlsx'  # File path to save the chi2 test results
+folder = 'visuals/' # File path for saving visuals
+jobs = 1 # Number of indicators analysed in parallel (e.g., the number of CPU cores)
+cache = None # Folder to keep the results of each indicator, e.g. 'data/cache' (unchanged indicators are not analysed again, None: no result cache)
+screening = False # Add a sheet of chi-square tests of all the indicators by all the breakdown columns (ranked, with corrected p-values)
+monitor_log = None # JSON-lines file logging the time, memory and rows of each stage and indicator (None: not measured)
+profile_folder = None # Folder of the cProfile and tracemalloc profiles of each stage and indicator (None: not profiled)
+profile_modes = ['cpu', 'memory'] # Profilers run on each stage ('cpu': cProfile .prof files, 'memory': tracemalloc allocation sites)
+aggregates = None # SQLite file of the aggregate store, e.g. 'data/aggregates.sqlite': each run only counts the new rows of the dataset (None: count all the rows)
 
+"""
+Evaluation
+"""
 # Create indicators and provide additional details as needed (Evaluation)
 def statistics(df, indicators):
     age_group = bd.Indicator(df, "Age Group", 0, ['Q1_age'], i_cal=None, i_type='count', description='Age Group Distribution', period='endline', target = None, visual = False)
@@ -118,15 +130,14 @@ def statistics(df, indicators):
 def statistical_indicators(df, indicators):
     return indicators
 
-# Create the PMF class ('Project Title', 'Evaluation')
-calabash = pmf.PerformanceManagementFramework('Calabash', 'Evaluation')
-
-indicators = []
-indicators = statistics(df, indicators)
-indicators = statistical_indicators(df, indicators)
-calabash.add_indicators(indicators)
+# All the indicators of the project (defined on the columns of the dataset, conditions should be declarative)
+def define_indicators(df):
+    indicators = []
+    indicators = statistics(df, indicators)
+    indicators = statistical_indicators(df, indicators)
+    return indicators
 
-file_path1 = 'data/Calabash Statistics.xlsx' # File path to save the statistics (including breakdown data)
-file_path2 = 'data/Calabash Test Results.xlsx'  # File path to save the chi2 test results
-folder = 'visuals/' # File path for saving visuals
-calabash.PMF_generation(file_path1, file_path2, folder) # Run the PMF
+if __name__ == '__main__': # Required for running the indicators in parallel (jobs > 1)
+    # Run the PMF with the settings above, or run: python bodhi_cli.py bodhi_pipeline.py --help
+    import bodhi_cli
+    bodhi_cli.main([__file__])
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import pandas as pd
+import os
+
+
+class ReportWriter:
+
+    def __init__(self, file_path, first_sheet=None):
+        """
+        - Initialise the report writer class
+        - Sheets are collected in memory and the workbook is written once by save()
+
+        file_path: str, Directory of the Excel file to be created
+        first_sheet: str, Name of an empty sheet placed at the front of the workbook
+        """
+        self.file_path = file_path
+        self.sheets = {}
+        if first_sheet is not None:
+            self.sheets[first_sheet] = {'description': None, 'blocks': []}
+
+    def add_sheet(self, sheet_name, blocks, description=None):
+        """
+        - Register a sheet made of one or more tables written below each other
+        sheet_name: str, Name of the sheet
+        blocks: list, Tables of the sheet: [(dataframe, {'index': True, 'header': True, ...}), ...]
+        description: str, Title written in the cell B1 above the tables
+        """
+        self.sheets[sheet_name] = {'description': description, 'blocks': list(blocks)}
+
+    def merge(self, sheets):
+        """
+        - Add sheets collected by another report writer (keeping their order)
+        sheets: dic, Sheets from ReportWriter.sheets
+        """
+        for sheet_name, sheet in sheets.items():
+            self.sheets[sheet_name] = sheet
+
+    def save(self, formats=None):
+        """
+        - Write all the collected sheets to the Excel file (and/or to CSV files)
+        formats: list, Formats of the report ('xlsx', 'csv'; None: ['xlsx'])
+        """
+        formats = ['xlsx'] if formats is None else formats
+        if 'csv' in formats:
+            self.save_csv()
+        if 'xlsx' not in formats:
+            return True
+        from openpyxl.styles import Font # Imported on first use (slow to import)
+        from openpyxl.utils import get_column_letter
+        with pd.ExcelWriter(self.file_path, engine='openpyxl') as writer:
+            for sheet_name, sheet in self.sheets.items():
+                description = sheet['description']
+                blocks = sheet['blocks']
+                if len(blocks) == 0:
+                    pd.DataFrame().to_excel(writer, sheet_name=sheet_name, index=False)
+                    continue
+
+                startrow = 0 if description is None else 1
+                for df, options in blocks:
+                    df.to_excel(writer, sheet_name=sheet_name, startrow=startrow, **options)
+                    startrow += df.shape[0] + 2
+
+                ws = writer.sheets[sheet_name]
+                if description is not None:
+                    ws['B1'] = description
+                    ws['B1'].font = Font(bold=True)
+                for i, width in enumerate(column_widths(blocks, description)):
+                    ws.column_dimensions[get_column_letter(i + 1)].width = width
+        return True
+
+    def save_csv(self):
+        """
+        - Write each collected sheet to a CSV file (tables written below each other, like in the Excel file)
+        - The files are saved in a folder named after the Excel file: 'data/Tables.xlsx' -> 'data/Tables/(sheet).csv'
+        """
+        folder = os.path.splitext(self.file_path)[0]
+        os.makedirs(folder, exist_ok=True)
+        for sheet_name, sheet in self.sheets.items():
+            if len(sheet['blocks']) == 0:
+                continue
+            file_name = ''.join('_' if char in '\\/:*?"<>|' else char for char in sheet_name)
+            with open(os.path.join(folder, f'{file_name}.csv'), 'w', newline='', encoding='utf-8') as f:
+                if sheet['description'] is not None:
+                    pd.DataFrame([[sheet['description']]]).to_csv(f, index=False, header=False)
+                for number, (df, options) in enumerate(sheet['blocks']):
+                    if number > 0:
+                        f.write('\n')
+                    df.to_csv(f, index=options.get('index', True), header=options.get('header', True))
+        return True
+
+
+def text_length(value):
+    """
+    - Length of a value once it is written to a cell (empty cells count as 0)
+    value: Value of the cell
+    """
+    try:
+        if not value or pd.isna(value):
+            return 0
+    except (TypeError, ValueError):
+        pass
+    if isinstance(value, float):
+        value = float(f'{value:.16g}') # Excel keeps 16 significant digits
+        if value.is_integer():
+            value = int(value) # and stores 570.0 as 570
+    return len(str(value))
+
+
+def column_widths(blocks, description=None):
+    """
+    - Calculate the width of each column of a sheet from its tables (longest text + 2)
+    blocks: list, Tables of the sheet: [(dataframe, options), ...]
+    description: str, Title written in the cell B1
+    """
+    lengths = {}
+
+    def update(position, values):
+        longest = max((text_length(value) for value in values), default=0)
+        lengths[position] = max(lengths.get(position, 0), longest)
+
+    if description is not None:
+        update(1, [description])
+
+    for df, options in blocks:
+        offset = 0
+        if options.get('index', True):
+            index = df.index
+            offset = index.nlevels
+            for level in range(index.nlevels):
+                update(level, list(index.get_level_values(level)) + [index.names[level]])
+            if isinstance(df.columns, pd.MultiIndex):
+                update(offset - 1, list(df.columns.names))
+        for position, column in enumerate(df.columns):
+            labels = list(column) if isinstance(column, tuple) else [column]
+            update(offset + position, labels + list(df.iloc[:, position]))
+
+    if len(lengths) == 0:
+        return []
+    return [lengths.get(i, 0) + 2 for i in range(max(lengths) + 1)]
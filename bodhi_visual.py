@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+import warnings
+from bodhi_monitor import RunMonitor, monitor_stage
+
+warnings.filterwarnings("ignore")
+plt = None # matplotlib.pyplot, imported when the first chart is rendered (see pyplot())
+
+bodhi_blue = (0.0745, 0.220, 0.396)
+bodhi_grey = (0.247, 0.29, 0.322)
+bodhi_primary_1 = (0.239, 0.38, 0.553)
+bodhi_secondary = (0.133, 0.098, 0.42)
+bodhi_tertiary = (0.047, 0.396, 0.298)
+bodhi_complement = (0.604, 0.396, 0.071)
+bodhi_palette = [bodhi_complement, bodhi_blue, bodhi_tertiary, bodhi_primary_1, bodhi_grey, bodhi_secondary]
+render_version = 1 # Increase when the rendering code changes so that cached charts are rendered again
+
+
+class ChartRenderer:
+
+    def __init__(self, jobs=1, manifest=None, monitor=None):
+        """
+        - Initialise the chart renderer class
+        - Charts are submitted as chart specs (dic) and rendered inline or by a pool of processes
+
+        jobs: int, Number of processes rendering the charts
+        -> 0: Keep the chart specs only (rendered later by another renderer)
+        -> 1: Render each chart as soon as it is submitted
+        -> 2 or more: Render the charts in parallel, wait() blocks until all of them are saved
+        manifest: str, Directory of the chart cache (JSON file), charts whose spec has not changed are not rendered again
+        monitor: RunMonitor, Run monitor measuring each chart (None: not measured)
+        """
+        self.jobs = jobs
+        self.monitor = monitor
+        self.specs = []
+        self.futures = []
+        self.pool = None
+        self.manifest = manifest
+        self.cache = {}
+        self.skipped = 0
+        if manifest is not None and os.path.exists(manifest):
+            with open(manifest) as f:
+                self.cache = json.load(f)
+        if jobs > 1:
+            self.pool = ProcessPoolExecutor(max_workers=jobs, initializer=init_render_worker)
+
+    def submit(self, spec):
+        """
+        - Submit a chart to be rendered
+        spec: dic, Chart spec from chart_spec()
+        """
+        if self.jobs == 0:
+            self.specs.append(spec)
+            return True
+
+        output_file = spec['output_file']
+        key = None
+        if self.manifest is not None:
+            key = chart_key(spec)
+            if self.cache.get(output_file) == key and os.path.exists(output_file):
+                self.skipped += 1
+                return True
+            self.cache.pop(output_file, None)
+
+        if self.pool is None:
+            try:
+                with monitor_stage(self.monitor, 'plot', chart_name(spec), len(spec['df']), chart=spec['chart']):
+                    render_chart(spec)
+                if key is not None:
+                    self.cache[output_file] = key
+            except Exception as e:
+                print(f"Unexpected error rendering {output_file}: {e}")
+        else:
+            if self.monitor is None:
+                future = self.pool.submit(render_chart, spec)
+            else: future = self.pool.submit(render_monitored, spec, self.monitor.settings())
+            self.futures.append((output_file, key, future))
+        return True
+
+    def wait(self):
+        """
+        - Wait until all the submitted charts are saved (and update the chart cache)
+        """
+        for output_file, key, future in self.futures:
+            try:
+                result = future.result()
+                if isinstance(result, dict): # Measured in the rendering process (render_monitored)
+                    self.monitor.record(result)
+                if key is not None:
+                    self.cache[output_file] = key
+            except Exception as e:
+                print(f"Unexpected error rendering {output_file}: {e}")
+        self.futures = []
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.manifest is not None:
+            with open(self.manifest, 'w') as f:
+                json.dump(self.cache, f, indent=1, sort_keys=True)
+            if self.skipped > 0:
+                print(f"{self.skipped} unchanged charts have not been rendered again")
+        return True
+
+
+def pyplot():
+    """
+    - Import matplotlib on first use (it is slow to import and runs without plots do not need it)
+    """
+    global plt
+    if plt is None:
+        import matplotlib.pyplot
+        plt = matplotlib.pyplot
+        plt.rcParams['figure.dpi'] = 600
+    return plt
+
+
+def chart_name(spec):
+    """
+    - Name of a chart in the run monitor (file name of the chart without its folder and extension)
+    spec: dic, Chart spec from chart_spec()
+    """
+    return os.path.splitext(os.path.basename(spec['output_file']))[0]
+
+
+def render_monitored(spec, settings=None):
+    """
+    - Render a chart spec in a rendering process and return its measured event for the run monitor
+    spec: dic, Chart spec from chart_spec()
+    settings: dic, Profile settings of the run monitor (RunMonitor.settings())
+    """
+    monitor = RunMonitor(**(settings or {}))
+    with monitor.stage('plot', chart_name(spec), len(spec['df']), chart=spec['chart'], process=os.getpid()):
+        render_chart(spec)
+    return monitor.events[0]
+
+
+def init_render_worker():
+    """
+    - Use the headless backend in the rendering processes
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def chart_manifest(folder):
+    """
+    - Directory of the chart cache kept next to the plot folder
+    folder: str, Directory where plots will be saved (e.g., 'visuals/' -> 'visuals.charts.json')
+    """
+    return f"{folder.rstrip('/').rstrip(os.sep)}.charts.json"
+
+
+def chart_key(spec):
+    """
+    - Hash of everything that changes the rendered chart (data, labels, lines and style)
+    spec: dic, Chart spec from chart_spec()
+    """
+    options = {name: value for name, value in spec.items() if name != 'df'}
+    content = repr(sorted(options.items())) + spec['df'].to_csv() + repr(spec['df'].dtypes.tolist()) + str(render_version)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def chart_spec(chart, df, title, output_file, i_type, target=None, baseline=None, midline=None,
+               var_order=None, breakdown=None, palette=None, figsize=(12, 8), rotation=0, fontsize=12):
+    """
+    - Create a lightweight (picklable) description of a chart
+    chart: str, Type of the chart ('bar', 'count' or 'percentage')
+    df: Dataframe, Data of the chart
+    title: str, Title of the chart
+    output_file: str, Directory where the chart will be saved
+    i_type: str, Type of the indicator ('Count' or 'Percentage')
+    target, baseline, midline: float, Values drawn as horizontal lines (None: no line)
+    var_order: list, Sequence of responses from the variable
+    breakdown: str, Name of the breakdown (legend title of the breakdown charts)
+    palette: list, Colours of the bars
+    figsize: tuple, Size of plots
+    rotation: int, Rotation angle for the x-axis ticks
+    fontsize: int, Font size for plots
+    """
+    if palette is None:
+        palette = bodhi_palette
+    return {'chart': chart, 'df': df.copy(), 'title': title, 'output_file': output_file, 'i_type': i_type,
+            'target': target, 'baseline': baseline, 'midline': midline, 'var_order': var_order,
+            'breakdown': breakdown, 'palette': palette, 'figsize': figsize, 'rotation': rotation, 'fontsize': fontsize}
+
+
+def render_chart(spec):
+    """
+    - Render a chart spec and save it as a PNG file
+    spec: dic, Chart spec from chart_spec()
+    """
+    pyplot()
+    if spec['chart'] == 'bar':
+        render_bar(spec)
+    elif spec['chart'] == 'count':
+        render_count_bar(spec)
+    elif spec['chart'] == 'percentage':
+        render_percentage_bar(spec)
+    return spec['output_file']
+
+
+def replace_spaces(text):
+    """
+    - Break long tick labels into several lines
+    text: str, Tick label
+    """
+    delimiters = [' ', '/']
+    if len(text) >= 13:
+        spaces = [i for i, char in enumerate(text) if char in delimiters]
+        if len(spaces) >= 3:
+            text = text[:spaces[0]] + '\n' + text[spaces[0] + 1:spaces[2]] + '\n' + text[spaces[2] + 1:]
+        elif len(spaces) >= 1:
+            text = text[:spaces[0]] + '\n' + text[spaces[0]+1:]
+    return text
+
+
+def draw_lines(ax, spec):
+    """
+    - Draw the target, baseline and midline of the chart
+    ax: Axes, Axes of the chart
+    spec: dic, Chart spec from chart_spec()
+    """
+    if spec['target'] is not None:
+        ax.axhline(y=spec['target'], color='red', linestyle='--', linewidth=0.5, label='Target')
+    if spec['baseline'] is not None:
+        ax.axhline(y=spec['baseline'], color='blue', linestyle='--', linewidth=0.5, label='Baseline')
+    if spec['midline'] is not None:
+        ax.axhline(y=spec['midline'], color='green', linestyle='--', linewidth=0.5,  label='Midline')
+
+
+def render_count_bar(spec):
+    """
+    - To generate bar plots through the breakdown data (Count only)
+    spec: dic, Chart spec from chart_spec()
+    """
+    from matplotlib.ticker import MaxNLocator
+    df = spec['df']
+    breakdown = spec['breakdown']
+    title = spec['title']
+    fontsize = spec['fontsize']
+    rotation = spec['rotation']
+    if spec['var_order'] != None:
+        df = df.loc[spec['var_order']]
+    ax = df.plot(kind='bar', stacked=False, width=0.6, figsize=spec['figsize'], color=spec['palette'])
+
+    ax.set_ylabel('Count')
+    ax.set_title(title)
+    column_totals = df.sum(axis=0)
+
+    bar_width = ax.patches[0].get_width()
+    fontsize_auto = max(fontsize * (bar_width / 0.85), 8)
+
+    for i, column in enumerate(df.columns):
+        for j in range(len(df)):
+            bar_index = i * len(df) + j
+            bar = ax.patches[bar_index]
+            bar_x = bar.get_x() + bar.get_width() / 2
+            bar_height = bar.get_height()
+            value = df[column].iloc[j]
+            percentage = (value / column_totals[column]) * 100
+            text = f'{value}\n({percentage:.1f}%)'
+            ax.text(bar_x, bar_height, text, ha='center', va='bottom', fontsize=fontsize_auto)
+
+    draw_lines(ax, spec)
+
+    plt.title(title, fontsize=fontsize + 4)
+    plt.xlabel(" ", fontsize=fontsize)
+    plt.ylabel("Count", fontsize = fontsize)
+    df.index = df.index.map(lambda x: x if isinstance(x, str) else ''.join(x))
+    labels = [''.join(label) if isinstance(label, tuple) else label for label in df.index]
+    labels = [replace_spaces(label) for label in labels]
+    ax.set_xticklabels(labels, rotation=rotation, fontsize=fontsize)
+    plt.legend(title=f'{breakdown} and Target', fontsize=fontsize-1)
+    max_height = df.max().max()
+    plt.ylim(0, max_height * 1.1)
+    ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+    plt.savefig(spec['output_file'], bbox_inches='tight', dpi=800)
+    plt.close()
+
+
+def render_percentage_bar(spec):
+    """
+    - To generate bar plots through the breakdown data (Percentage only)
+    spec: dic, Chart spec from chart_spec()
+    """
+    df = spec['df']
+    breakdown = spec['breakdown']
+    title = spec['title']
+    fontsize = spec['fontsize']
+    rotation = spec['rotation']
+    if spec['var_order'] != None:
+        df = df.loc[spec['var_order']]
+    ax = df.plot(kind='bar', stacked=False, width=0.6, figsize=spec['figsize'], color=spec['palette'])
+
+    ax.set_ylabel('Percentage')
+    ax.set_title(title)
+    bar_width = ax.patches[0].get_width()
+    fontsize_auto = max(fontsize * (bar_width / 0.85), 8)
+    for i in ax.containers:
+        ax.bar_label(i, labels=[f'{p:.0f}%' for p in df[i.get_label()]], label_type='edge', fontsize=fontsize_auto)
+
+    draw_lines(ax, spec)
+
+    plt.title(title, fontsize=fontsize + 4)
+    plt.xlabel(" ", fontsize=fontsize)
+    plt.ylabel("Percentage", fontsize = fontsize)
+    plt.ylim(0, 105)
+    plt.yticks([0, 20, 40, 60, 80, 100])
+    df.index = df.index.map(lambda x: x if isinstance(x, str) else ''.join(x))
+    labels = [''.join(label) if isinstance(label, tuple) else label for label in df.index]
+    labels = [replace_spaces(label) for label in labels]
+    ax.set_xticklabels(labels, rotation=rotation, fontsize=fontsize)
+    plt.xticks(rotation=rotation, fontsize=fontsize)
+    plt.legend(title=f'{breakdown} and Target', fontsize=fontsize-1)
+    plt.savefig(spec['output_file'], bbox_inches='tight', dpi=800)
+    plt.close()
+
+
+def render_bar(spec):
+    """
+    - To generate bar plot for overall information
+    spec: dic, Chart spec from chart_spec()
+    """
+    from matplotlib.ticker import MaxNLocator
+    from matplotlib.patches import Patch
+    df_ = spec['df']
+    title = spec['title']
+    palette = spec['palette']
+    figsize = spec['figsize']
+    fontsize = spec['fontsize']
+    rotation = spec['rotation']
+    i_type = spec['i_type']
+    if spec['var_order'] != None:
+        df_ = df_.loc[spec['var_order']]
+    df_.dropna(subset=['Count', 'Percentage'], inplace=True)
+    fig, ax = plt.subplots(figsize=figsize)
+    if i_type == 'Count':
+        df2 = df_['Count']
+        df2.plot(kind='bar', color=palette, figsize=figsize, ax = ax)
+        bars = ax.patches
+        total = df_['Count'].values.sum()
+        for bar in bars:
+            height = bar.get_height()
+            percentage = (height / total) * 100
+            ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height(),
+                 f'{height:.0f} ({percentage:.1f}%)',
+                 ha='center', va='bottom', fontsize=fontsize+2)
+        max_height = df_.max().max()
+        ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+        plt.ylim(0, max_height * 1.1)
+
+    elif i_type == 'Percentage':
+        df_['Percentage'].plot(kind='bar', color=palette, figsize=figsize, ax = ax)
+        bars = ax.patches
+        for bar, (idx, row) in zip(bars, df_.iterrows()):
+            percentage = row['Percentage']
+            count = row['Count']
+            label = f'{percentage:.1f}% ({int(count)})'
+            ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height(), label,ha='center', va='bottom', fontsize=fontsize + 2)
+        plt.ylim(0, 105)
+        plt.yticks([0, 20, 40, 60, 80, 100])
+
+    draw_lines(ax, spec)
+
+    df_.index = df_.index.map(lambda x: x if isinstance(x, str) else ''.join(x))
+    labels = [''.join(label) if isinstance(label, tuple) else label for label in df_.index]
+    labels = [replace_spaces(label) for label in labels]
+    plt.title(title, fontsize=fontsize + 4)
+    plt.xlabel(" ", fontsize=fontsize)
+    plt.ylabel(i_type, fontsize = fontsize)
+    ax.set_xticks(range(len(labels)))
+    ax.set_xticklabels(labels, rotation=rotation, fontsize=fontsize)
+    bar_handles = [Patch(color=palette[i], label=label) for i, label in enumerate(labels)]
+    line_handles, _ = ax.get_legend_handles_labels()
+    handles = bar_handles + line_handles[:-1]
+    ax.legend(handles=handles, title="Category", loc='best')
+    plt.savefig(spec['output_file'], bbox_inches='tight', dpi=800)
+    plt.close()
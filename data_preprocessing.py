@@ -8,6 +8,7 @@
 Please define the parameters for data preprocessing pipeline
 """
 import bodhi_data_preprocessing as dp
+from bodhi_monitor import RunMonitor
 
 project_name = "Perception about the rights of persons with disabilities in The Gambia"
 
@@ -39,6 +40,46 @@ list_del_cols = ['Q5_type_dis','Q8_perception']
 miss_col = ['Timestamp', 'Consent', 'Q1_age', 'Q2_sex', 'Q3_region', 'Q4_dis_knowledge', 'Q6_source', 'Q7_policy_knowledge','Q9_excluded', 'Q10_barriers']
 # Specify all columns that apply to all respondents for missing value detection
 
+save_type = 'xlsx'
+# Cleaned data format: xlsx, xls, csv, parquet, arrow
+# parquet and arrow files load much faster and keep the sequence of responses below (pyarrow is required)
+
+knowledge = ['No knowledge', 'Minimal knowledge', 'Basic knowledge', 'Adequate knowledge', 'Excellent knowledge']
+categories = {'Q4_dis_knowledge': knowledge, 'Q7_policy_knowledge': knowledge}
+# Specify the sequence of responses of the categorical columns (kept in the parquet and arrow files)
+
+multi_select = {'5. What types of disabilities are you aware of?\n(select more than one if applicable)': 'Q5_',
+                '8. Check the box if you agree with the statements': 'Q8_'}
+# Specify the multi-select questions (original column names) and the prefix of their answer columns
+# For example, the answers '1,3' of Q5 are saved as Q5_1 = 1 and Q5_3 = 1
+
+knowledge_map = {number + 1: answer for number, answer in enumerate(knowledge)}
+value_maps = {'4. How would you rate your level of knowledge about disabilities?': knowledge_map,
+              '7. How would you rate your level of knowledge about government policies or strategies such as the Persons with Disabilities Act?': knowledge_map}
+# Specify the questions (original column names) whose answer codes are replaced with the answers
+
+chunksize = None
+# Number of rows processed at once for very large csv datasets (file_type and save_type 'csv'), e.g. 100000
+# The cleaned dataset is written chunk by chunk so the memory use does not grow with the dataset (None: load the whole dataset)
+
+checkpoint = "Data/checkpoints"
+# Folder where the output of each cleaning stage is saved, reruns skip the stages whose inputs have not changed
+# (None: no checkpoints)
+
+append = False
+# During fieldwork: only process the submissions of the export made at or after the latest submission already processed
+# (Timestamp), remove the duplicates against all the rows processed so far and append the new rows to the cleaned dataset
+# The first run processes the whole dataset, the watermark and the index of the identifiers are saved next to the cleaned dataset
+
+monitor_log = None
+# JSON-lines file where the time, CPU time, memory and number of rows of each stage are logged, e.g. "Data/preprocessing_events.jsonl"
+# A summary of the slowest stages is printed at the end (None: not measured)
+
+profile_folder = None
+# Folder where each stage is profiled, e.g. "Data/profiles" (None: not profiled)
+# 'cpu': cProfile statistics of each stage (.prof files), 'memory': top allocation sites of each stage (tracemalloc)
+profile_modes = ['cpu', 'memory']
+
 
 """
 Run the pipeline for data preprocessing
@@ -48,5 +89,10 @@ del_type = 0 or 1
       Then, remove all remaining missing values from the columns where they are detected
 """
 
-calabash = dp.Preprocessing(project_name, file_path, file_path_others, list_del_cols, dates, miss_col, identifiers, cols_new,  del_type = 0, file_type=file_type)
-calabash.processing()
\ No newline at end of file
+if __name__ == '__main__':
+    calabash = dp.Preprocessing(project_name, file_path, file_path_others, list_del_cols, dates, miss_col, identifiers, cols_new,  del_type = 0, file_type=file_type,
+                                save_type=save_type, categories=categories, checkpoint=checkpoint,
+                                multi_select=multi_select, value_maps=value_maps, chunksize=chunksize, append=append,
+                                monitor=RunMonitor(monitor_log, profile=profile_folder, profile_modes=profile_modes)
+                                        if monitor_log is not None or profile_folder is not None else None)
+    calabash.processing()
\ No newline at end of file